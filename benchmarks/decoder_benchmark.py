@@ -0,0 +1,83 @@
+"""
+Messages/sec of the stock IB Decoder against sibi's server-version-specialized FastDecoder.
+
+Usage: python benchmarks/decoder_benchmark.py [--server-version 151] [--seconds 1.0]
+"""
+import argparse
+import time
+
+from sibi.fast_decoder import FastDecoder
+from sibi.framing import FieldBuffer
+from sibi.ibapi.decoder import Decoder
+from sibi.ibapi.message import IN
+from sibi.ibapi.server_versions import MAX_CLIENT_VER
+from sibi.ibapi.wrapper import EWrapper
+
+
+class NullWrapper(EWrapper):
+    """ Swallows every callback, so that only decoding is measured """
+
+    def _noop(self, *args):
+        pass
+
+    tickPrice = tickSize = orderStatus = historicalData = historicalDataEnd = _noop
+    tickOptionComputation = realtimeBar = updateMktDepthL2 = error = _noop
+
+
+def frame(*values) -> bytes:
+    return b"".join(str(value).encode() + b"\0" for value in values)
+
+
+def bars(count: int) -> list:
+    values = []
+    for i in range(count):
+        values += [f"20210104  10:{i % 60:02d}:00", 370.1, 370.5, 369.9, 370.2, 1200, 370.25, 87]
+    return values
+
+
+MESSAGES = {
+    "TICK_PRICE": frame(IN.TICK_PRICE, 6, 1, 1, 370.15, 300, 3),
+    "TICK_SIZE": frame(IN.TICK_SIZE, 6, 1, 0, 300),
+    "ORDER_STATUS": frame(
+        IN.ORDER_STATUS, 12, "Submitted", 0, 100, 0, 1234567, 0, 0, 0, "", 0
+    ),
+    "TICK_OPTION_COMPUTATION": frame(
+        IN.TICK_OPTION_COMPUTATION, 6, 1, 13, 0.21, 0.5, 3.1, 0, 0.02, 0.3, -0.05, 370
+    ),
+    "HISTORICAL_DATA (100 bars)": frame(
+        IN.HISTORICAL_DATA, 1, "20210104", "20210105", 100, *bars(100)
+    ),
+}
+
+
+def rate(decoder, payload: bytes, seconds: float) -> float:
+    interpret = decoder.interpret
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(200):
+            interpret(FieldBuffer(payload))
+        count += 200
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server-version", type=int, default=MAX_CLIENT_VER)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    generic = Decoder(NullWrapper(), args.server_version)
+    specialized = FastDecoder(NullWrapper(), args.server_version)
+    specialized.specialize()
+
+    print(f"{'message':<28}{'before msg/s':>14}{'after msg/s':>14}{'speedup':>9}")
+    for name, payload in MESSAGES.items():
+        before = rate(generic, payload, args.seconds)
+        after = rate(specialized, payload, args.seconds)
+        print(f"{name:<28}{before:>14,.0f}{after:>14,.0f}{after / before:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ from twisted.protocols.policies import ThrottlingFactory
 from twisted.web import server
 
 from sibi.ib_factory import IBClientFactory
+from sibi.publisher import RedisPublisher
+from sibi.shm import ShmTickWriter
+from sibi.ticks import parseTickTypes
+from sibi.wire import parseWireFormats
 from sibi.xmlrpc_server import XMLRPCServer
 
 
@@ -14,8 +18,66 @@ class Sibi:
         tws_port: int,
         tws_max_connections: int,
         xmlrpc_port: int,
+        coalesce_writes: bool = False,
+        coalesce_window_us: int = 0,
+        tws_max_msg_rate: float = 40,
+        tws_msg_burst: int = 10,
+        history_cache_path: str = None,
+        history_cache_max_bars: int = 10_000_000,
+        contract_cache_size: int = 50_000,
+        contract_cache_ttl: float = 86400,
+        contract_master_path: str = None,
+        contract_refresh_interval: float = 60,
+        contract_refresh_batch: int = 20,
+        tick_conflation_ms: int = 0,
+        tick_passthrough: bool = True,
+        redis_host: str = "localhost",
+        redis_port: int = 6379,
+        redis_db: int = 0,
+        redis_max_backlog: int = 100_000,
+        redis_drop_policy: str = "oldest",
+        redis_mode: str = "pubsub",
+        redis_stream_maxlen: int = 100_000,
+        wire_format: str = "json",
+        shm_name: str = None,
+        shm_capacity: int = 65536,
+        redis_tick_types: str = "",
+        shm_tick_types: str = "",
     ):
-        ib_factory = IBClientFactory(client_id)
+        publisher = RedisPublisher(
+            redis_host,
+            redis_port,
+            redis_db,
+            maxBacklog=redis_max_backlog,
+            dropPolicy=redis_drop_policy,
+            mode=redis_mode,
+            streamMaxLen=redis_stream_maxlen,
+        )
+        tick_ring = None
+        if shm_name:
+            tick_ring = ShmTickWriter(shm_name, shm_capacity)
+            reactor.addSystemEventTrigger("after", "shutdown", tick_ring.close)
+        ib_factory = IBClientFactory(
+            client_id,
+            coalesceWrites=coalesce_writes,
+            coalesceWindow=coalesce_window_us / 1e6,
+            maxMsgRate=tws_max_msg_rate,
+            msgBurst=tws_msg_burst,
+            historicalCachePath=history_cache_path,
+            historicalCacheMaxBars=history_cache_max_bars,
+            contractCacheSize=contract_cache_size,
+            contractCacheTTL=contract_cache_ttl,
+            contractMasterPath=contract_master_path,
+            contractRefreshInterval=contract_refresh_interval,
+            contractRefreshBatch=contract_refresh_batch,
+            tickConflation=tick_conflation_ms / 1e3,
+            tickPassthrough=tick_passthrough,
+            publisher=publisher,
+            wireFormats=parseWireFormats(wire_format),
+            tickRing=tick_ring,
+            redisTickTypes=parseTickTypes(redis_tick_types),
+            shmTickTypes=parseTickTypes(shm_tick_types),
+        )
         reactor.connectTCP(tws_host, tws_port, ib_factory)
 
         # create XMLRPC SERVER ENDPOINT
@@ -0,0 +1,234 @@
+import json
+import sqlite3
+import time
+from typing import List, Tuple
+
+from loguru import logger
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from sibi.history import toEpoch
+from sibi.ibapi.contract import Contract
+from sibi.models import COLUMNS, HistoricalBars
+from sibi.pacing import CONTRACT_KEY_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    bars INTEGER NOT NULL DEFAULT 0,
+    lastUsed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    seriesId INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverageSeries ON coverage (seriesId);
+CREATE TABLE IF NOT EXISTS bars (
+    seriesId INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    date TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER,
+    barCount INTEGER,
+    average REAL,
+    PRIMARY KEY (seriesId, ts)
+) WITHOUT ROWID;
+"""
+
+# Gaps shorter than this (seconds) are rounding noise, not missing data
+MIN_GAP = 1.0
+
+
+class HistoricalBarCache:
+    """sqlite cache of historical bars, one series per contract, bar size, whatToShow, useRTH and
+    formatDate. For every series it remembers which time ranges (epoch seconds) were already
+    fetched, so that only the gaps of a request have to be asked to TWS.
+
+    Series are evicted least recently used first once the cache holds more than maxBars bars.
+
+    The methods block on sqlite: from the reactor thread, call them through **defer**, which runs
+    them one at a time in the cache's own worker thread.
+
+    Args:
+        path (str): The sqlite database file
+        maxBars (int): How many bars the cache holds at most
+        clock: The reactor
+    """
+
+    def __init__(self, path: str, maxBars: int = 10_000_000, clock=reactor) -> None:
+        self.path = path
+        self.maxBars = maxBars
+        self.clock = clock
+        self.pool = ThreadPool(1, 1, name="historicalCache")
+        # Used by the worker thread only, once created
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.hits = 0
+        self.partialHits = 0
+        self.misses = 0
+        self.barsServed = 0
+        self.barsFetched = 0
+        self.evictions = 0
+
+    def defer(self, function, *args, **kwargs) -> Deferred:
+        """ Runs function (eg. a method of the cache) in the cache worker thread """
+
+        if not self.pool.started:
+            self.pool.start()
+            self.clock.addSystemEventTrigger("during", "shutdown", self.pool.stop)
+        return deferToThreadPool(self.clock, self.pool, function, *args, **kwargs)
+
+    @staticmethod
+    def seriesKey(
+        contract: Contract, barSizeSetting: str, whatToShow: str, useRTH: int, formatDate: int
+    ) -> str:
+        contractKey = [getattr(contract, field, None) for field in CONTRACT_KEY_FIELDS]
+        return json.dumps([contractKey, barSizeSetting, whatToShow, int(useRTH), int(formatDate)])
+
+    def _seriesId(self, key: str, create: bool = False):
+        row = self.db.execute("SELECT id FROM series WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        cursor = self.db.execute(
+            "INSERT INTO series (key, lastUsed) VALUES (?, ?)", (key, time.time())
+        )
+        return cursor.lastrowid
+
+    def _coverage(self, seriesId: int) -> List[Tuple[float, float]]:
+        return self.db.execute(
+            "SELECT start, end FROM coverage WHERE seriesId = ? ORDER BY start", (seriesId,)
+        ).fetchall()
+
+    def gaps(self, key: str, start: float, end: float) -> List[Tuple[float, float]]:
+        """ Ranges of [start, end] not fetched yet, oldest first. Updates the hit/miss counters """
+
+        seriesId = self._seriesId(key)
+        covered = self._coverage(seriesId) if seriesId is not None else []
+
+        gaps = []
+        position = start
+        for coveredStart, coveredEnd in covered:
+            if coveredEnd <= position:
+                continue
+            if coveredStart >= end:
+                break
+            if coveredStart - position >= MIN_GAP:
+                gaps.append((position, coveredStart))
+            position = max(position, coveredEnd)
+        if end - position >= MIN_GAP:
+            gaps.append((position, end))
+
+        if not gaps:
+            self.hits += 1
+        elif gaps == [(start, end)]:
+            self.misses += 1
+        else:
+            self.partialHits += 1
+        return gaps
+
+    def store(self, key: str, bars: HistoricalBars, start: float, end: float) -> None:
+        """ Saves bars, fetched for [start, end], and marks that range as covered """
+
+        seriesId = self._seriesId(key, create=True)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (seriesId, toEpoch(date), date, *values)
+                    for date, *values in zip(*(getattr(bars, name) for name in COLUMNS))
+                ),
+            )
+
+            ranges = self._coverage(seriesId) + [(start, end)]
+            ranges.sort()
+            merged = [list(ranges[0])]
+            for rangeStart, rangeEnd in ranges[1:]:
+                if rangeStart <= merged[-1][1] + MIN_GAP:
+                    merged[-1][1] = max(merged[-1][1], rangeEnd)
+                else:
+                    merged.append([rangeStart, rangeEnd])
+            self.db.execute("DELETE FROM coverage WHERE seriesId = ?", (seriesId,))
+            self.db.executemany(
+                "INSERT INTO coverage VALUES (?, ?, ?)",
+                ((seriesId, rangeStart, rangeEnd) for rangeStart, rangeEnd in merged),
+            )
+            self.db.execute(
+                "UPDATE series SET bars = (SELECT count(*) FROM bars WHERE seriesId = ?), "
+                "lastUsed = ? WHERE id = ?",
+                (seriesId, time.time(), seriesId),
+            )
+        self.barsFetched += len(bars)
+        self.evict(keep=seriesId)
+
+    def load(self, key: str, start: float, end: float) -> HistoricalBars:
+        """ Bars of the series between start and end, ordered by time """
+
+        bars = HistoricalBars()
+        seriesId = self._seriesId(key)
+        if seriesId is None:
+            return bars
+
+        columns = [getattr(bars, name) for name in COLUMNS]
+        rows = self.db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM bars WHERE seriesId = ? AND ts >= ? AND ts <= ? "
+            "ORDER BY ts",
+            (seriesId, start, end),
+        )
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+        with self.db:
+            self.db.execute("UPDATE series SET lastUsed = ? WHERE id = ?", (time.time(), seriesId))
+        self.barsServed += len(bars)
+        return bars
+
+    def evict(self, keep: int = None) -> None:
+        """ Drops least recently used series until at most maxBars bars are cached """
+
+        total = self.db.execute("SELECT coalesce(sum(bars), 0) FROM series").fetchone()[0]
+        if total <= self.maxBars:
+            return
+
+        candidates = self.db.execute(
+            "SELECT id, bars FROM series WHERE id != ? ORDER BY lastUsed", (keep,)
+        ).fetchall()
+        with self.db:
+            for seriesId, count in candidates:
+                if total <= self.maxBars:
+                    break
+                for table, column in (("bars", "seriesId"), ("coverage", "seriesId"), ("series", "id")):
+                    self.db.execute(f"DELETE FROM {table} WHERE {column} = ?", (seriesId,))
+                total -= count
+                self.evictions += 1
+        logger.info(f"Historical cache evicted down to {total} bars")
+
+    def stats(self) -> dict:
+        series, bars = self.db.execute(
+            "SELECT count(*), coalesce(sum(bars), 0) FROM series"
+        ).fetchone()
+        pageCount = self.db.execute("PRAGMA page_count").fetchone()[0]
+        pageSize = self.db.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "path": self.path,
+            "series": series,
+            "bars": bars,
+            "maxBars": self.maxBars,
+            "bytes": pageCount * pageSize,
+            "hits": self.hits,
+            "partialHits": self.partialHits,
+            "misses": self.misses,
+            "barsServed": self.barsServed,
+            "barsFetched": self.barsFetched,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,115 @@
+import json
+import time
+from typing import Callable
+
+from loguru import logger
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from sibi.ibapi.ticktype import TickTypeEnum
+
+
+class TickConflator:
+    """Keeps only the latest value of every reqId/tickType and publishes, once per interval, one
+    snapshot per reqId with the tick types changed since the previous one:
+
+        {"reqId": 5, "time": 1600000000.1, "ticks": {"BID": 101.5, "BID_SIZE": 300},
+         "receivedAt": 2454178226113, ...contract}
+
+    receivedAt is the receive time (time.monotonic_ns) of the newest tick of the snapshot.
+
+    Args:
+        publish (Callable): Publishes a message (channel, message)
+        interval (float): Seconds between two snapshots
+        additionalInfo (dict): Extra fields merged into the snapshot of a reqId (eg. its contract)
+        channel (str): Where snapshots are published
+        wireFormat: A sibi.wire format snapshots are encoded with instead of JSON
+        clock: The reactor (or a twisted.internet.task.Clock)
+    """
+
+    tickTypes = None
+
+    def __init__(
+        self,
+        publish: Callable[[str, object], None],
+        interval: float,
+        additionalInfo: dict = None,
+        channel: str = "tickSnapshot",
+        wireFormat=None,
+        clock=reactor,
+    ) -> None:
+        self.publish = publish
+        self.interval = interval
+        self.additionalInfo = {} if additionalInfo is None else additionalInfo
+        self.channel = channel
+        self.wireFormat = wireFormat
+        self.pending = {}  # reqId -> {tickType: value}
+        self.receivedAt = {}  # reqId -> receive time of its newest pending tick
+        self.received = 0
+        self.published = 0
+        self.loop = LoopingCall(self.flush)
+        self.loop.clock = clock
+
+    def start(self) -> None:
+        self.loop.start(self.interval, now=False)
+
+    def stop(self) -> None:
+        if self.loop.running:
+            self.loop.stop()
+
+    def update(self, reqId: int, tickType: int, value, receivedAt: int = None) -> None:
+        ticks = self.pending.get(reqId)
+        if ticks is None:
+            ticks = self.pending[reqId] = {}
+        ticks[tickType] = value
+        if receivedAt is not None:
+            self.receivedAt[reqId] = receivedAt
+        self.received += 1
+
+    def emit(self, event) -> None:
+        """ Tick pipeline sink """
+
+        self.update(event.reqId, event.tickType, event.value, event.receivedAt)
+
+    def flush(self) -> None:
+        """ Publishes the snapshot of every reqId updated since the last flush """
+
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        receivedAt, self.receivedAt = self.receivedAt, {}
+        if self.wireFormat is not None:
+            now = time.time_ns()
+            for reqId, ticks in pending.items():
+                self.publish(
+                    self.channel,
+                    self.wireFormat.encodeTicks(
+                        reqId, ticks.items(), now, receivedAt.get(reqId, 0)
+                    ),
+                )
+            self.published += len(pending)
+            return
+
+        now = time.time()
+        for reqId, ticks in pending.items():
+            data = {
+                "reqId": reqId,
+                "time": now,
+                "ticks": {TickTypeEnum.to_str(tickType): value for tickType, value in ticks.items()},
+            }
+            if reqId in receivedAt:
+                data["receivedAt"] = receivedAt[reqId]
+            info = self.additionalInfo.get(reqId)
+            if info:
+                data = {**data, **info}
+            self.publish(self.channel, json.dumps(data))
+        self.published += len(pending)
+        logger.debug(f"Published {len(pending)} tick snapshots")
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "received": self.received,
+            "published": self.published,
+            "pending": len(self.pending),
+        }
@@ -0,0 +1,172 @@
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from sibi.ibapi.contract import Contract
+
+RIGHTS = {"CALL": "C", "PUT": "P"}
+
+# Contract fields making up a queryKey, in order
+QUERY_FIELDS = (
+    "conId",
+    "symbol",
+    "secType",
+    "currency",
+    "exchange",
+    "primaryExchange",
+    "lastTradeDateOrContractMonth",
+    "strike",
+    "right",
+    "multiplier",
+    "localSymbol",
+    "tradingClass",
+    "includeExpired",
+    "secIdType",
+    "secId",
+)
+
+
+def queryKey(contract: Contract) -> tuple:
+    """ Normalized contract details query: same key, same TWS answer """
+
+    strike = contract.strike
+    try:
+        strike = float(strike or 0)
+    except ValueError:
+        pass
+    right = (contract.right or "").upper()
+    return (
+        int(contract.conId or 0),
+        (contract.symbol or "").upper(),
+        (contract.secType or "").upper(),
+        (contract.currency or "").upper(),
+        (contract.exchange or "").upper(),
+        (contract.primaryExchange or "").upper(),
+        contract.lastTradeDateOrContractMonth or "",
+        strike,
+        RIGHTS.get(right, right),
+        contract.multiplier or "",
+        contract.localSymbol or "",
+        contract.tradingClass or "",
+        bool(contract.includeExpired),
+        (contract.secIdType or "").upper(),
+        contract.secId or "",
+    )
+
+
+def queryContract(key: tuple) -> Contract:
+    """ The Contract to send to TWS to repeat the query with queryKey key """
+
+    contract = Contract()
+    for field, value in zip(QUERY_FIELDS, key):
+        setattr(contract, field, value)
+    return contract
+
+
+class ContractCache:
+    """LRU cache of contract details answers, with a time to live.
+
+    Answers are indexed by normalized query (see queryKey) and every contract they hold by conId.
+
+    Args:
+        maxSize (int): How many queries (and as many contracts) are kept at most
+        ttl (float): Seconds after which an entry is stale
+        clock (Callable): Returns the current time in seconds
+    """
+
+    def __init__(self, maxSize: int = 50_000, ttl: float = 86400, clock: Callable = time.time):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.clock = clock
+        self.queries = OrderedDict()  # queryKey -> (expiresAt, [contract dict])
+        self.contracts = OrderedDict()  # conId -> (expiresAt, contract dict)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, index: OrderedDict, key):
+        entry = index.get(key)
+        if entry is None:
+            return None
+        expiresAt, value = entry
+        if expiresAt <= self.clock():
+            del index[key]
+            self.expirations += 1
+            return None
+        index.move_to_end(key)
+        return value
+
+    def _put(self, index: OrderedDict, key, value, updatedAt: float = None) -> None:
+        index[key] = ((self.clock() if updatedAt is None else updatedAt) + self.ttl, value)
+        index.move_to_end(key)
+        while len(index) > self.maxSize:
+            index.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, contract: Contract) -> Optional[List[dict]]:
+        """ Cached contract details answer for contract, by conId when it has one """
+
+        if contract.conId:
+            found = self._get(self.contracts, int(contract.conId))
+            found = None if found is None else [found]
+        else:
+            found = self._get(self.queries, queryKey(contract))
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def getByConId(self, conId: int) -> Optional[dict]:
+        found = self._get(self.contracts, int(conId))
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def put(self, key: tuple, contracts: List[dict], updatedAt: float = None) -> None:
+        """Caches the contract details answer to the query with queryKey key.
+
+        Args:
+            key (tuple): The queryKey of the query
+            contracts (list): The contract dicts TWS answered with
+            updatedAt (float): When TWS answered, defaults to now
+        """
+
+        self._put(self.queries, key, contracts, updatedAt)
+        for contract in contracts:
+            if contract.get("conId"):
+                self._put(self.contracts, int(contract["conId"]), contract, updatedAt)
+
+    def resolve(self, contract: Contract) -> Contract:
+        """Fills the blank fields of contract from its cached definition (looked up by conId, or by
+        query when it matches exactly one contract). contract is returned unchanged on a miss.
+        """
+
+        found = self.get(contract)
+        if not found or len(found) != 1:
+            return contract
+        for field, value in found[0].items():
+            if not getattr(contract, field, None) and value:
+                setattr(contract, field, value)
+        return contract
+
+    def clear(self) -> None:
+        self.queries.clear()
+        self.contracts.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "queries": len(self.queries),
+            "contracts": len(self.contracts),
+            "maxSize": self.maxSize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
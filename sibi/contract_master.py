@@ -0,0 +1,153 @@
+import json
+import sqlite3
+import time
+from typing import List, Tuple
+
+from loguru import logger
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from sibi.contract_cache import QUERY_FIELDS, ContractCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    conId INTEGER PRIMARY KEY,
+    symbol TEXT,
+    secType TEXT,
+    expiry TEXT,
+    data TEXT NOT NULL,
+    updatedAt REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contractsSymbol ON contracts (symbol);
+CREATE INDEX IF NOT EXISTS contractsExpiry ON contracts (expiry);
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    conIds TEXT NOT NULL,
+    updatedAt REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queriesUpdatedAt ON queries (updatedAt);
+"""
+
+
+class ContractMaster:
+    """sqlite store of every contract details answer received from TWS, so that a restarted sibi
+    can fill its ContractCache without asking TWS again.
+
+    The methods block on sqlite: once the reactor runs, call them through **defer**, which runs
+    them one at a time in the master's own worker thread.
+
+    Args:
+        path (str): The sqlite database file
+        clock: The reactor
+    """
+
+    def __init__(self, path: str, clock=reactor) -> None:
+        self.path = path
+        self.clock = clock
+        self.pool = ThreadPool(1, 1, name="contractMaster")
+        # Used by the worker thread only, once created
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.forgetOtherKeys()
+
+    def forgetOtherKeys(self) -> None:
+        """ Forgets the queries stored with another queryKey layout, which queryContract cannot repeat """
+
+        with self.db:
+            forgotten = self.db.execute(
+                "DELETE FROM queries WHERE json_array_length(key) != ?", (len(QUERY_FIELDS),)
+            ).rowcount
+            if forgotten:
+                self.db.execute(
+                    "DELETE FROM contracts WHERE conId NOT IN (SELECT value FROM queries, json_each(queries.conIds))"
+                )
+                logger.info(f"Forgot {forgotten} contract queries stored with another key layout")
+
+    def defer(self, function, *args, **kwargs) -> Deferred:
+        """ Runs function (eg. a method of the master) in the master worker thread """
+
+        if not self.pool.started:
+            self.pool.start()
+            self.clock.addSystemEventTrigger("during", "shutdown", self.pool.stop)
+        return deferToThreadPool(self.clock, self.pool, function, *args, **kwargs)
+
+    def save(self, key: tuple, contracts: List[dict], updatedAt: float = None) -> None:
+        """ Stores the contract details answer to the query with queryKey key """
+
+        updatedAt = time.time() if updatedAt is None else updatedAt
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO contracts VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        contract["conId"],
+                        contract.get("symbol"),
+                        contract.get("secType"),
+                        contract.get("lastTradeDateOrContractMonth"),
+                        json.dumps(contract),
+                        updatedAt,
+                    )
+                    for contract in contracts
+                    if contract.get("conId")
+                ),
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                (
+                    json.dumps(key),
+                    json.dumps([contract.get("conId") for contract in contracts]),
+                    updatedAt,
+                ),
+            )
+
+    def delete(self, key: tuple) -> None:
+        """ Forgets a query, eg. because its contracts expired, and its contracts no other query returns """
+
+        key = json.dumps(key)
+        with self.db:
+            row = self.db.execute("SELECT conIds FROM queries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            self.db.execute("DELETE FROM queries WHERE key = ?", (key,))
+            self.db.execute(
+                "DELETE FROM contracts WHERE conId IN (SELECT value FROM json_each(?)) "
+                "AND conId NOT IN (SELECT value FROM queries, json_each(queries.conIds))",
+                row,
+            )
+
+    def preload(self, cache: ContractCache) -> int:
+        """ Fills cache with every stored answer, returns how many were loaded """
+
+        contracts = {
+            conId: json.loads(data)
+            for conId, data in self.db.execute("SELECT conId, data FROM contracts")
+        }
+        loaded = 0
+        for key, conIds, updatedAt in self.db.execute(
+            "SELECT key, conIds, updatedAt FROM queries ORDER BY updatedAt"
+        ):
+            answer = [contracts[conId] for conId in json.loads(conIds) if conId in contracts]
+            cache.put(tuple(json.loads(key)), answer, updatedAt)
+            loaded += 1
+        logger.info(f"Preloaded {loaded} contract queries ({len(contracts)} contracts)")
+        return loaded
+
+    def stale(self, olderThan: float, limit: int) -> List[Tuple[tuple, float]]:
+        """ The (queryKey, updatedAt) of at most limit queries last answered before olderThan, oldest first """
+
+        return [
+            (tuple(json.loads(key)), updatedAt)
+            for key, updatedAt in self.db.execute(
+                "SELECT key, updatedAt FROM queries WHERE updatedAt < ? ORDER BY updatedAt LIMIT ?",
+                (olderThan, limit),
+            )
+        ]
+
+    def stats(self) -> dict:
+        contracts = self.db.execute("SELECT count(*) FROM contracts").fetchone()[0]
+        queries, oldest = self.db.execute("SELECT count(*), min(updatedAt) FROM queries").fetchone()
+        return {"path": self.path, "contracts": contracts, "queries": queries, "oldest": oldest}
@@ -1,14 +1,56 @@
 import json
 from functools import wraps
 
-import redis
 from loguru import logger
 from twisted.internet import defer
 
-try:
-    r = redis.StrictRedis(host="localhost", port=6379, db=0)
-except Exception as e:
-    logger.error(e)
+
+def normalize(value):
+    """ Hashable, order independent representation of request arguments (Contracts, TagValues, lists...) """
+
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item)) for key, item in value.items()))
+    if hasattr(value, "__dict__"):
+        return type(value).__name__, normalize(vars(value))
+    return value
+
+
+def coalesce(method):
+    """Single-flight for requests returning a Deferred: while a call is in flight, identical calls
+    (same method and normalized arguments) don't reach TWS but wait for its result.
+    Goes on top of **@request**.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, normalize(args), normalize(kwargs))
+        waiters = self.inflightRequests.get(key)
+        if waiters is not None:
+            logger.debug(f"Coalescing {method.__name__} with the request in flight")
+            waiter = defer.Deferred()
+            waiters.append(waiter)
+            return waiter
+
+        waiters = self.inflightRequests[key] = []
+
+        def release(result):
+            # The key may be gone (or held by a newer call) if the connection was lost meanwhile
+            if self.inflightRequests.get(key) is waiters:
+                del self.inflightRequests[key]
+            for waiter in waiters:
+                waiter.callback(result)
+            return result
+
+        try:
+            deferred = method(self, *args, **kwargs)
+        except Exception:
+            del self.inflightRequests[key]
+            raise
+        return deferred.addBoth(release)
+
+    return wrapper
 
 
 def request(method=None, order=False):
@@ -59,20 +101,49 @@ def resolve(method=None, order=False):
     return _decorate
 
 
+def payloadTemplate(info: dict) -> tuple:
+    """Serializes once the static fields (eg. the contract) merged into every event of a request.
+
+    Returns:
+        tuple: (field names, JSON of info without its opening brace)
+    """
+
+    return frozenset(info), json.dumps(info)[1:]
+
+
+def serialize(data: dict, info: dict = None, payload: tuple = None) -> str:
+    """ JSON of data merged with the additional info of its request (payload is its payloadTemplate) """
+
+    if payload is not None and payload[0] and data and payload[0].isdisjoint(data):
+        # Same text as json.dumps({**data, **info}), without encoding info again
+        return f"{json.dumps(data)[:-1]}, {payload[1]}"
+    if info:
+        data = {**data, **info}
+    return json.dumps(data)
+
+
 def publish(method=None, order=False):
     def _decorate(function):
         @wraps(function)
         def wrapper(self, *args, **kwargs):
             data = function(self, *args, **kwargs)
+            if data is None:
+                return None
+            receivedAt = self.receivedAt
+            if receivedAt is not None:
+                self.latency["decode"].since(receivedAt)
+                data = {**data, "receivedAt": receivedAt}
             if order:
                 additionalInfoDict = self.additionalOrderInfo
+                payloadDict = self.additionalOrderPayloads
             else:
                 additionalInfoDict = self.additionalRequestInfo
+                payloadDict = self.additionalRequestPayloads
             identifier = args[0]
-            if additionalInfoDict.get(identifier):
-                data = {**data, **additionalInfoDict[identifier]}
-            data = json.dumps(data)
-            r.publish(function.__name__, data)
+            data = serialize(
+                data, additionalInfoDict.get(identifier), payloadDict.get(identifier)
+            )
+            self.publishMessage(function.__name__, data)
             logger.debug(f"Pushing data on channel {function.__name__}")
             return data
 
@@ -0,0 +1,409 @@
+import struct
+from functools import lru_cache
+from operator import attrgetter
+from typing import Optional
+
+from loguru import logger
+
+from sibi.ibapi.common import UNSET_DOUBLE, UNSET_INTEGER
+from sibi.ibapi.contract import Contract
+from sibi.ibapi.message import OUT
+from sibi.ibapi.order import Order
+from sibi.ibapi.server_versions import (
+    MIN_SERVER_VER_PRICE_MGMT_ALGO,
+    MIN_SERVER_VER_REQ_SMART_COMPONENTS,
+    MIN_SERVER_VER_SYNT_REALTIME_BARS,
+)
+
+# How many pre-encoded contract sections are kept per message type
+CONTRACT_CACHE_SIZE = 4096
+
+CONTRACT_FIELDS = (
+    "conId",
+    "symbol",
+    "secType",
+    "lastTradeDateOrContractMonth",
+    "strike",
+    "right",
+    "multiplier",
+    "exchange",
+    "primaryExchange",
+    "currency",
+    "localSymbol",
+    "tradingClass",
+)
+
+# Order fields sent by placeOrder as they are (make_field)...
+ORDER_FIELDS_HEAD = (
+    "tif",
+    "ocaGroup",
+    "account",
+    "openClose",
+    "origin",
+    "orderRef",
+    "transmit",
+    "parentId",
+    "blockOrder",
+    "sweepToFill",
+    "displaySize",
+    "triggerMethod",
+    "outsideRth",
+    "hidden",
+)
+ORDER_FIELDS_FA = (
+    "discretionaryAmt",
+    "goodAfterTime",
+    "goodTillDate",
+    "faGroup",
+    "faMethod",
+    "faPercentage",
+    "faProfile",
+    "modelCode",
+    "shortSaleSlot",
+    "designatedLocation",
+    "exemptCode",
+    "ocaType",
+    "rule80A",
+    "settlingFirm",
+    "allOrNone",
+)
+# ... and the ones prefixed with "!" go through make_field_handle_empty
+ORDER_FIELDS_MAIN = (
+    "!minQty",
+    "!percentOffset",
+    "eTradeOnly",
+    "firmQuoteOnly",
+    "!nbboPriceCap",
+    "auctionStrategy",
+    "!startingPrice",
+    "!stockRefPrice",
+    "!delta",
+    "!stockRangeLower",
+    "!stockRangeUpper",
+    "overridePercentageConstraints",
+    "!volatility",
+    "!volatilityType",
+    "deltaNeutralOrderType",
+    "!deltaNeutralAuxPrice",
+)
+ORDER_FIELDS_DELTA_NEUTRAL = (
+    "deltaNeutralConId",
+    "deltaNeutralSettlingFirm",
+    "deltaNeutralClearingAccount",
+    "deltaNeutralClearingIntent",
+    "deltaNeutralOpenClose",
+    "deltaNeutralShortSale",
+    "deltaNeutralShortSaleSlot",
+    "deltaNeutralDesignatedLocation",
+)
+ORDER_FIELDS_SCALE = (
+    "continuousUpdate",
+    "!referencePriceType",
+    "!trailStopPrice",
+    "!trailingPercent",
+    "!scaleInitLevelSize",
+    "!scaleSubsLevelSize",
+    "!scalePriceIncrement",
+)
+ORDER_FIELDS_SCALE_EXTRA = (
+    "!scalePriceAdjustValue",
+    "!scalePriceAdjustInterval",
+    "!scaleProfitOffset",
+    "scaleAutoReset",
+    "!scaleInitPosition",
+    "!scaleInitFillQty",
+    "scaleRandomPercent",
+)
+ORDER_FIELDS_TABLE = ("scaleTable", "activeStartTime", "activeStopTime", "hedgeType")
+ORDER_FIELDS_ROUTING = ("optOutSmartRouting", "clearingAccount", "clearingIntent", "notHeld")
+ORDER_FIELDS_TAIL = (
+    "adjustedOrderType",
+    "triggerPrice",
+    "lmtPriceOffset",
+    "adjustedStopPrice",
+    "adjustedStopLimitPrice",
+    "adjustedTrailingAmount",
+    "adjustableTrailingUnit",
+    "extOperator",
+    "softDollarTier.name",
+    "softDollarTier.val",
+    "cashQty",
+    "mifid2DecisionMaker",
+    "mifid2DecisionAlgo",
+    "mifid2ExecutionTrader",
+    "mifid2ExecutionAlgo",
+    "dontUseAutoPriceForHedge",
+    "isOmsContainer",
+    "discretionaryUpToLimitPrice",
+)
+
+
+# str() of the huge UNSET_DOUBLE default is by far the slowest field conversion, and orders carry many
+UNSET_DOUBLE_STR = str(UNSET_DOUBLE)
+
+
+def _field(value) -> str:
+    """ comm.make_field without the terminator """
+
+    kind = type(value)
+    if kind is str:
+        return value
+    if value is None:
+        raise ValueError("Cannot send None to TWS")
+    if kind is bool:
+        return "1" if value else "0"
+    if kind is float and value == UNSET_DOUBLE:
+        return UNSET_DOUBLE_STR
+    return str(value)
+
+
+def _fieldHandleEmpty(value) -> str:
+    """ comm.make_field_handle_empty without the terminator """
+
+    if value is None:
+        raise ValueError("Cannot send None to TWS")
+    if UNSET_INTEGER == value or UNSET_DOUBLE == value:
+        return ""
+    return _field(value)
+
+
+def _encode(fields) -> bytes:
+    """ Terminates every field and encodes them, exactly as comm.make_msg does for ASCII text """
+
+    return ("\0".join(fields) + "\0").encode("ascii")
+
+
+def _converter(names):
+    """ Returns a function turning an object into the list of encoded-to-str fields names """
+
+    getters = []
+    for name in names:
+        if name.startswith("!"):
+            getters.append((attrgetter(name[1:]), _fieldHandleEmpty))
+        else:
+            getters.append((attrgetter(name), _field))
+
+    def convert(obj) -> list:
+        return [encode(get(obj)) for (get, encode) in getters]
+
+    return convert
+
+
+def _contractSection(names):
+    """ Returns an LRU cached encoder of the contract section, keyed by the values it encodes """
+
+    getValues = attrgetter(*names)
+
+    @lru_cache(maxsize=CONTRACT_CACHE_SIZE)
+    def encodeValues(values: tuple, types: tuple) -> bytes:
+        return _encode([_field(value) for value in values])
+
+    def encode(contract: Contract) -> bytes:
+        values = getValues(contract)
+        # types are part of the key: 0 == 0.0 == False, but they are encoded differently
+        return encodeValues(values, tuple(map(type, values)))
+
+    encode.cache_info = encodeValues.cache_info
+    return encode
+
+
+def _frame(*parts: bytes) -> bytes:
+    payload = b"".join(parts)
+    return struct.pack("!I", len(payload)) + payload
+
+
+class RequestEncoder:
+    """Encodes the hottest outbound requests straight into length-prefixed frames.
+
+    The static prefix of every message is encoded once per server version and the contract
+    section is encoded once per contract (and cached), so a burst of subscriptions or orders
+    only pays for the few fields that actually change.
+    The frames are byte-identical to the ones EClient builds. Whenever a request needs
+    something the templates do not cover (an older server version, BAG or delta-neutral
+    contracts, order conditions, non-ASCII text...) the encoder returns None and the caller
+    falls back to EClient.
+    """
+
+    def __init__(self) -> None:
+        self.serverVersion = None
+        self.mktDataContract = _contractSection(CONTRACT_FIELDS)
+        self.historicalDataContract = _contractSection(CONTRACT_FIELDS + ("includeExpired",))
+        self.contractDetailsContract = _contractSection(
+            CONTRACT_FIELDS + ("includeExpired", "secIdType", "secId")
+        )
+        self.placeOrderContract = _contractSection(CONTRACT_FIELDS + ("secIdType", "secId"))
+        self.orderHead = _converter(ORDER_FIELDS_HEAD)
+        self.orderFA = _converter(ORDER_FIELDS_FA)
+        self.orderMain = _converter(ORDER_FIELDS_MAIN)
+        self.orderDeltaNeutral = _converter(ORDER_FIELDS_DELTA_NEUTRAL)
+        self.orderScale = _converter(ORDER_FIELDS_SCALE)
+        self.orderScaleExtra = _converter(ORDER_FIELDS_SCALE_EXTRA)
+        self.orderTable = _converter(ORDER_FIELDS_TABLE)
+        self.orderRouting = _converter(ORDER_FIELDS_ROUTING)
+        self.orderTail = _converter(ORDER_FIELDS_TAIL)
+        self.specialize(None)
+
+    def specialize(self, serverVersion: Optional[int]) -> None:
+        """ Pre-encodes the static prefixes for serverVersion (None disables the templates) """
+
+        self.serverVersion = serverVersion
+        supports = serverVersion is not None
+        # Each template is only defined for versions where every optional field is sent
+        self.mktDataPrefix = (
+            _encode([_field(OUT.REQ_MKT_DATA), "11"])
+            if supports and serverVersion >= MIN_SERVER_VER_REQ_SMART_COMPONENTS
+            else None
+        )
+        self.historicalDataPrefix = (
+            _encode([_field(OUT.REQ_HISTORICAL_DATA)])
+            if supports and serverVersion >= MIN_SERVER_VER_SYNT_REALTIME_BARS
+            else None
+        )
+        self.contractDetailsPrefix = (
+            _encode([_field(OUT.REQ_CONTRACT_DATA), "8"]) if supports else None
+        )
+        self.placeOrderPrefix = (
+            _encode([_field(OUT.PLACE_ORDER)])
+            if supports and serverVersion >= MIN_SERVER_VER_PRICE_MGMT_ALGO
+            else None
+        )
+        logger.debug(f"Request templates specialized for server version {serverVersion}")
+
+    @staticmethod
+    def _isPlain(contract: Contract) -> bool:
+        return contract.secType != "BAG" and not contract.deltaNeutralContract
+
+    def reqMktData(
+        self,
+        reqId: int,
+        contract: Contract,
+        genericTickList: str,
+        snapshot: bool,
+        regulatorySnapshot: bool,
+        mktDataOptions: list,
+    ) -> Optional[bytes]:
+        if self.mktDataPrefix is None or mktDataOptions or not self._isPlain(contract):
+            return None
+        try:
+            return _frame(
+                self.mktDataPrefix,
+                _encode([_field(reqId)]),
+                self.mktDataContract(contract),
+                # deltaNeutralContract flag, genericTickList, snapshot, regulatorySnapshot, mktDataOptions
+                _encode(
+                    ["0", _field(genericTickList), _field(snapshot), _field(regulatorySnapshot), ""]
+                ),
+            )
+        except UnicodeEncodeError:
+            return None
+
+    def reqHistoricalData(
+        self,
+        reqId: int,
+        contract: Contract,
+        endDateTime: str,
+        durationStr: str,
+        barSizeSetting: str,
+        whatToShow: str,
+        useRTH: int,
+        formatDate: int,
+        keepUpToDate: bool,
+        chartOptions: list,
+    ) -> Optional[bytes]:
+        if self.historicalDataPrefix is None or contract.secType == "BAG":
+            return None
+        chartOptionsStr = "".join(str(tagValue) for tagValue in chartOptions or ())
+        try:
+            return _frame(
+                self.historicalDataPrefix,
+                _encode([_field(reqId)]),
+                self.historicalDataContract(contract),
+                _encode(
+                    [
+                        _field(endDateTime),
+                        _field(barSizeSetting),
+                        _field(durationStr),
+                        _field(useRTH),
+                        _field(whatToShow),
+                        _field(formatDate),
+                        _field(keepUpToDate),
+                        chartOptionsStr,
+                    ]
+                ),
+            )
+        except UnicodeEncodeError:
+            return None
+
+    def reqContractDetails(self, reqId: int, contract: Contract) -> Optional[bytes]:
+        if self.contractDetailsPrefix is None:
+            return None
+        try:
+            return _frame(
+                self.contractDetailsPrefix,
+                _encode([_field(reqId)]),
+                self.contractDetailsContract(contract),
+            )
+        except UnicodeEncodeError:
+            return None
+
+    def placeOrder(self, orderId: int, contract: Contract, order: Order) -> Optional[bytes]:
+        if (
+            self.placeOrderPrefix is None
+            or not self._isPlain(contract)
+            or order.conditions
+            or order.orderType == "PEG BENCH"
+            or order.orderMiscOptions
+        ):
+            return None
+
+        flds = [
+            _field(order.action),
+            _field(order.totalQuantity),
+            _field(order.orderType),
+            _fieldHandleEmpty(order.lmtPrice),
+            _fieldHandleEmpty(order.auxPrice),
+        ]
+        flds += self.orderHead(order)
+        flds.append("")  # deprecated sharesAllocation
+        flds += self.orderFA(order)
+        flds += self.orderMain(order)
+        if order.deltaNeutralOrderType:
+            flds += self.orderDeltaNeutral(order)
+        flds += self.orderScale(order)
+        if order.scalePriceIncrement != UNSET_DOUBLE and order.scalePriceIncrement > 0.0:
+            flds += self.orderScaleExtra(order)
+        flds += self.orderTable(order)
+        if order.hedgeType:
+            flds.append(_field(order.hedgeParam))
+        flds += self.orderRouting(order)
+        flds.append("0")  # no deltaNeutralContract
+        flds.append(_field(order.algoStrategy))
+        if order.algoStrategy:
+            algoParams = order.algoParams or []
+            flds.append(_field(len(algoParams)))
+            for algoParam in algoParams:
+                flds += [_field(algoParam.tag), _field(algoParam.value)]
+        flds += [
+            _field(order.algoId),
+            _field(order.whatIf),
+            "",  # miscOptions
+            _field(order.solicited),
+            _field(order.randomizeSize),
+            _field(order.randomizePrice),
+            "0",  # no conditions
+        ]
+        flds += self.orderTail(order)
+        if order.usePriceMgmtAlgo is None:
+            flds.append("")
+        else:
+            flds.append("1" if order.usePriceMgmtAlgo else "0")
+
+        try:
+            return _frame(
+                self.placeOrderPrefix,
+                _encode([_field(orderId)]),
+                self.placeOrderContract(contract),
+                _encode(flds),
+            )
+        except UnicodeEncodeError:
+            return None
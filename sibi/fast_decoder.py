@@ -0,0 +1,578 @@
+from array import array
+from itertools import islice
+from time import perf_counter_ns
+
+from loguru import logger
+
+from sibi.ibapi.common import NO_VALID_ID, BarData, RealTimeBar, TickAttrib
+from sibi.ibapi.decoder import Decoder, HandleInfo
+from sibi.ibapi.errors import BAD_MESSAGE
+from sibi.ibapi.message import IN
+from sibi.ibapi.server_versions import (
+    MIN_SERVER_VER_FRACTIONAL_POSITIONS,
+    MIN_SERVER_VER_MARKET_CAP_PRICE,
+    MIN_SERVER_VER_PAST_LIMIT,
+    MIN_SERVER_VER_PRE_OPEN_BID_ASK,
+    MIN_SERVER_VER_REALIZED_PNL,
+    MIN_SERVER_VER_SMART_DEPTH,
+    MIN_SERVER_VER_SYNT_REALTIME_BARS,
+    MIN_SERVER_VER_UNREALIZED_PNL,
+)
+from sibi.ibapi.ticktype import TickTypeEnum
+from sibi.ibapi.utils import BadMessage
+from sibi.models import HistoricalBars
+
+SIZE_TICK_TYPES = {
+    TickTypeEnum.BID: TickTypeEnum.BID_SIZE,
+    TickTypeEnum.ASK: TickTypeEnum.ASK_SIZE,
+    TickTypeEnum.LAST: TickTypeEnum.LAST_SIZE,
+    TickTypeEnum.DELAYED_BID: TickTypeEnum.DELAYED_BID_SIZE,
+    TickTypeEnum.DELAYED_ASK: TickTypeEnum.DELAYED_ASK_SIZE,
+    TickTypeEnum.DELAYED_LAST: TickTypeEnum.DELAYED_LAST_SIZE,
+}
+
+
+def _str(field: bytes) -> str:
+    return field.decode(errors="backslashreplace")
+
+
+def _text(field: bytes) -> str:
+    try:
+        return field.decode("UTF-8")
+    except UnicodeDecodeError:
+        return field.decode("latin-1")
+
+
+def signatureHandler(wrapper, handleInfo: HandleInfo):
+    """
+    Generates the process function of a signature-driven (HandleInfo(wrap=...)) message.
+    The conversion of every field is derived once from the EWrapper annotations and the target
+    method is bound once, so no inspect.Parameter walking nor getattr happens per message.
+    """
+
+    method = getattr(wrapper, handleInfo.wrapperMeth.__name__)
+    annotations = [
+        param.annotation
+        for (name, param) in handleInfo.wrapperParams.items()
+        if name != "self"
+    ]
+    names = [f"f{i}" for i in range(len(annotations))]
+    args = []
+    for name, annotation in zip(names, annotations):
+        if annotation is int or annotation is float:
+            args.append(f"{annotation.__name__}({name})")
+        else:
+            args.append(f"_text({name})")
+
+    source = (
+        "def process(decoder, fields):\n"
+        "    values = tuple(fields)\n"
+        f"    if len(values) != {len(names) + 2}:\n"
+        "        logger.error(\n"
+        f"            f'diff len fields and params {{len(values)}} {len(names) + 1} for fields: {{values}} and method: {{method}}'\n"
+        "        )\n"
+        "        return\n"
+        f"    (_, _, {''.join(name + ', ' for name in names)}) = values\n"
+        f"    method({', '.join(args)})\n"
+    )
+    namespace = {"__name__": __name__, "method": method, "logger": logger, "_text": _text}
+    exec(compile(source, f"<{handleInfo.wrapperMeth.__name__} handler>", "exec"), namespace)
+    return namespace["process"]
+
+
+def tickPrice(wrapper, serverVersion: int):
+    wrapperTickPrice = wrapper.tickPrice
+    wrapperTickSize = wrapper.tickSize
+    sizeTickTypes = SIZE_TICK_TYPES
+
+    if serverVersion >= MIN_SERVER_VER_PRE_OPEN_BID_ASK:
+
+        def makeAttrib(attrMask):
+            attrib = TickAttrib()
+            attrib.canAutoExecute = attrMask & 1 != 0
+            attrib.pastLimit = attrMask & 2 != 0
+            attrib.preOpen = attrMask & 4 != 0
+            return attrib
+
+    elif serverVersion >= MIN_SERVER_VER_PAST_LIMIT:
+
+        def makeAttrib(attrMask):
+            attrib = TickAttrib()
+            attrib.canAutoExecute = attrMask & 1 != 0
+            attrib.pastLimit = attrMask & 2 != 0
+            return attrib
+
+    else:
+
+        def makeAttrib(attrMask):
+            attrib = TickAttrib()
+            attrib.canAutoExecute = attrMask == 1
+            return attrib
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            nxt()
+            reqId = int(nxt() or 0)
+            tickType = int(nxt() or 0)
+            price = float(nxt() or 0)
+            size = int(nxt() or 0)
+            attrMask = int(nxt() or 0)
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperTickPrice(reqId, tickType, price, makeAttrib(attrMask))
+
+        sizeTickType = sizeTickTypes.get(tickType)
+        if sizeTickType is not None:
+            wrapperTickSize(reqId, sizeTickType, size)
+
+    return process
+
+
+def orderStatus(wrapper, serverVersion: int):
+    wrapperOrderStatus = wrapper.orderStatus
+    hasVersion = serverVersion < MIN_SERVER_VER_MARKET_CAP_PRICE
+    hasMktCapPrice = not hasVersion
+    quantity = float if serverVersion >= MIN_SERVER_VER_FRACTIONAL_POSITIONS else int
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            if hasVersion:
+                nxt()
+            orderId = int(nxt() or 0)
+            status = _str(nxt())
+            filled = quantity(nxt() or 0)
+            remaining = quantity(nxt() or 0)
+            avgFillPrice = float(nxt() or 0)
+            permId = int(nxt() or 0)
+            parentId = int(nxt() or 0)
+            lastFillPrice = float(nxt() or 0)
+            clientId = int(nxt() or 0)
+            whyHeld = _str(nxt())
+            mktCapPrice = float(nxt() or 0) if hasMktCapPrice else None
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperOrderStatus(
+            orderId,
+            status,
+            filled,
+            remaining,
+            avgFillPrice,
+            permId,
+            parentId,
+            lastFillPrice,
+            clientId,
+            whyHeld,
+            mktCapPrice,
+        )
+
+    return process
+
+
+def _column(typecode: str, convert, values) -> array:
+    try:
+        return array(typecode, map(convert, values))
+    except ValueError:
+        # Empty fields decode to 0, as utils.decode does
+        return array(typecode, [convert(value or 0) for value in values])
+
+
+def historicalData(wrapper, serverVersion: int):
+    wrapperHistoricalDataEnd = wrapper.historicalDataEnd
+    wrapperHistoricalDataColumns = getattr(wrapper, "historicalDataColumns", None)
+    legacy = serverVersion < MIN_SERVER_VER_SYNT_REALTIME_BARS
+    # date, open, high, low, close, volume, average, [legacy str], barCount
+    stride = 9 if legacy else 8
+
+    def processBars(nxt, reqId, itemCount):
+        wrapperHistoricalData = wrapper.historicalData
+        for _ in range(itemCount):
+            bar = BarData()
+            bar.date = _str(nxt())
+            bar.open = float(nxt() or 0)
+            bar.high = float(nxt() or 0)
+            bar.low = float(nxt() or 0)
+            bar.close = float(nxt() or 0)
+            bar.volume = int(nxt() or 0)
+            bar.average = float(nxt() or 0)
+            if legacy:
+                nxt()
+            bar.barCount = int(nxt() or 0)
+
+            wrapperHistoricalData(reqId, bar)
+
+    def processColumns(fields, reqId, itemCount):
+        values = tuple(islice(fields, itemCount * stride))
+        if len(values) < itemCount * stride:
+            raise BadMessage("no more fields")
+        bars = HistoricalBars(
+            date=[_str(value) for value in values[0::stride]],
+            open=_column("d", float, values[1::stride]),
+            high=_column("d", float, values[2::stride]),
+            low=_column("d", float, values[3::stride]),
+            close=_column("d", float, values[4::stride]),
+            volume=_column("q", int, values[5::stride]),
+            average=_column("d", float, values[6::stride]),
+            barCount=_column("q", int, values[stride - 1 :: stride]),
+        )
+        wrapperHistoricalDataColumns(reqId, bars)
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            if legacy:
+                nxt()
+            reqId = int(nxt() or 0)
+            startDateStr = _str(nxt())
+            endDateStr = _str(nxt())
+            itemCount = int(nxt() or 0)
+
+            if wrapperHistoricalDataColumns is not None:
+                processColumns(fields, reqId, itemCount)
+            else:
+                processBars(nxt, reqId, itemCount)
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperHistoricalDataEnd(reqId, startDateStr, endDateStr)
+
+    return process
+
+
+def historicalDataUpdate(wrapper, serverVersion: int):
+    wrapperHistoricalDataUpdate = wrapper.historicalDataUpdate
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            reqId = int(nxt() or 0)
+            bar = BarData()
+            bar.barCount = int(nxt() or 0)
+            bar.date = _str(nxt())
+            bar.open = float(nxt() or 0)
+            bar.close = float(nxt() or 0)
+            bar.high = float(nxt() or 0)
+            bar.low = float(nxt() or 0)
+            bar.average = float(nxt() or 0)
+            bar.volume = int(nxt() or 0)
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperHistoricalDataUpdate(reqId, bar)
+
+    return process
+
+
+def realtimeBar(wrapper, serverVersion: int):
+    wrapperRealtimeBar = wrapper.realtimeBar
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            nxt()
+            reqId = int(nxt() or 0)
+            bar = RealTimeBar()
+            bar.time = int(nxt() or 0)
+            bar.open = float(nxt() or 0)
+            bar.high = float(nxt() or 0)
+            bar.low = float(nxt() or 0)
+            bar.close = float(nxt() or 0)
+            bar.volume = int(nxt() or 0)
+            bar.wap = float(nxt() or 0)
+            bar.count = int(nxt() or 0)
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperRealtimeBar(
+            reqId,
+            bar.time,
+            bar.open,
+            bar.high,
+            bar.low,
+            bar.close,
+            bar.volume,
+            bar.wap,
+            bar.count,
+        )
+
+    return process
+
+
+def tickOptionComputation(wrapper, serverVersion: int):
+    wrapperTickOptionComputation = wrapper.tickOptionComputation
+    modelOptionTypes = (TickTypeEnum.MODEL_OPTION, TickTypeEnum.DELAYED_MODEL_OPTION)
+
+    def process(decoder, fields):
+        optPrice = None
+        pvDividend = None
+        gamma = None
+        vega = None
+        theta = None
+        undPrice = None
+
+        try:
+            nxt = fields.__next__
+            nxt()
+            version = int(nxt() or 0)
+            reqId = int(nxt() or 0)
+            tickTypeInt = int(nxt() or 0)
+            impliedVol = float(nxt() or 0)
+            delta = float(nxt() or 0)
+
+            if impliedVol < 0:  # -1 is the "not computed" indicator
+                impliedVol = None
+            if delta == -2:  # -2 is the "not computed" indicator
+                delta = None
+
+            if version >= 6 or tickTypeInt in modelOptionTypes:
+                optPrice = float(nxt() or 0)
+                pvDividend = float(nxt() or 0)
+                if optPrice == -1:
+                    optPrice = None
+                if pvDividend == -1:
+                    pvDividend = None
+
+            if version >= 6:
+                gamma = float(nxt() or 0)
+                vega = float(nxt() or 0)
+                theta = float(nxt() or 0)
+                undPrice = float(nxt() or 0)
+                if gamma == -2:
+                    gamma = None
+                if vega == -2:
+                    vega = None
+                if theta == -2:
+                    theta = None
+                if undPrice == -1:
+                    undPrice = None
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperTickOptionComputation(
+            reqId,
+            tickTypeInt,
+            impliedVol,
+            delta,
+            optPrice,
+            pvDividend,
+            gamma,
+            vega,
+            theta,
+            undPrice,
+        )
+
+    return process
+
+
+def marketDepthL2(wrapper, serverVersion: int):
+    wrapperUpdateMktDepthL2 = wrapper.updateMktDepthL2
+    hasSmartDepth = serverVersion >= MIN_SERVER_VER_SMART_DEPTH
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            nxt()
+            reqId = int(nxt() or 0)
+            position = int(nxt() or 0)
+            marketMaker = _str(nxt())
+            operation = int(nxt() or 0)
+            side = int(nxt() or 0)
+            price = float(nxt() or 0)
+            size = int(nxt() or 0)
+            isSmartDepth = int(nxt() or 0) != 0 if hasSmartDepth else False
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperUpdateMktDepthL2(
+            reqId, position, marketMaker, operation, side, price, size, isSmartDepth
+        )
+
+    return process
+
+
+def pnl(wrapper, serverVersion: int):
+    wrapperPnl = wrapper.pnl
+    hasUnrealized = serverVersion >= MIN_SERVER_VER_UNREALIZED_PNL
+    hasRealized = serverVersion >= MIN_SERVER_VER_REALIZED_PNL
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            reqId = int(nxt() or 0)
+            dailyPnL = float(nxt() or 0)
+            unrealizedPnL = float(nxt() or 0) if hasUnrealized else None
+            realizedPnL = float(nxt() or 0) if hasRealized else None
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperPnl(reqId, dailyPnL, unrealizedPnL, realizedPnL)
+
+    return process
+
+
+def pnlSingle(wrapper, serverVersion: int):
+    wrapperPnlSingle = wrapper.pnlSingle
+    hasUnrealized = serverVersion >= MIN_SERVER_VER_UNREALIZED_PNL
+    hasRealized = serverVersion >= MIN_SERVER_VER_REALIZED_PNL
+
+    def process(decoder, fields):
+        try:
+            nxt = fields.__next__
+            nxt()
+            reqId = int(nxt() or 0)
+            pos = int(nxt() or 0)
+            dailyPnL = float(nxt() or 0)
+            unrealizedPnL = float(nxt() or 0) if hasUnrealized else None
+            realizedPnL = float(nxt() or 0) if hasRealized else None
+            value = float(nxt() or 0)
+        except StopIteration:
+            raise BadMessage("no more fields")
+
+        wrapperPnlSingle(reqId, pos, dailyPnL, unrealizedPnL, realizedPnL, value)
+
+    return process
+
+
+# Builders of the specialized handlers: each one takes the wrapper and the server version
+# and returns a process function with the version checks already resolved
+SPECIALIZED_HANDLERS = {
+    IN.TICK_PRICE: tickPrice,
+    IN.ORDER_STATUS: orderStatus,
+    IN.HISTORICAL_DATA: historicalData,
+    IN.HISTORICAL_DATA_UPDATE: historicalDataUpdate,
+    IN.REAL_TIME_BARS: realtimeBar,
+    IN.TICK_OPTION_COMPUTATION: tickOptionComputation,
+    IN.MARKET_DEPTH_L2: marketDepthL2,
+    IN.PNL: pnl,
+    IN.PNL_SINGLE: pnlSingle,
+}
+
+
+MSG_NAMES = {value: name for name, value in vars(IN).items() if not name.startswith("_")}
+
+
+class TimedWrapper:
+    """Proxy of the wrapper whose methods add the time they take to decoder.callbackNs, so that
+    the decoder can tell its own time from the time spent in wrapper callbacks.
+    """
+
+    def __init__(self, wrapper, decoder: "FastDecoder") -> None:
+        self._wrapper = wrapper
+        self._decoder = decoder
+
+    def __getattr__(self, name: str):
+        method = getattr(self._wrapper, name)
+        if not callable(method):
+            return method
+        decoder = self._decoder
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            result = method(*args, **kwargs)
+            decoder.callbackNs += perf_counter_ns() - start
+            return result
+
+        setattr(self, name, timed)
+        return timed
+
+
+class FastDecoder(Decoder):
+    """Decoder that swaps its handlers for server-version-specialized ones once the version is known.
+
+    Until **specialize** is called it behaves exactly like the IB Decoder.
+
+    It also profiles every message type it decodes: messages, bytes, decoding time and time
+    spent in the wrapper callbacks (see **profile**).
+    """
+
+    def __init__(self, wrapper, serverVersion: int) -> None:
+        super().__init__(TimedWrapper(wrapper, self), serverVersion)
+        self.callbackNs = 0
+        self.counters = {}  # msgId -> [messages, bytes, decode ns, callback ns]
+
+    def interpret(self, fields) -> None:
+        """ Same as Decoder.interpret, minus the debug logging, plus the profiling counters """
+
+        if len(fields) == 0:
+            logger.debug("no fields")
+            return
+
+        msgId = int(fields[0])
+        handleInfo = self.msgId2handleInfo.get(msgId)
+        if handleInfo is None:
+            logger.debug(f"{msgId}: no handleInfo")
+            return
+
+        self.callbackNs = 0
+        start = perf_counter_ns()
+        try:
+            if handleInfo.wrapperMeth is not None:
+                self.interpretWithSignature(fields, handleInfo)
+            elif handleInfo.processMeth is not None:
+                handleInfo.processMeth(self, iter(fields))
+        except BadMessage:
+            theBadMsg = ",".join(field.decode(errors="backslashreplace") for field in fields)
+            self.wrapper.error(NO_VALID_ID, BAD_MESSAGE.code(), BAD_MESSAGE.msg() + theBadMsg)
+            raise
+        elapsed = perf_counter_ns() - start
+
+        counters = self.counters.get(msgId)
+        if counters is None:
+            counters = self.counters[msgId] = [0, 0, 0, 0]
+        callbackNs = self.callbackNs
+        counters[0] += 1
+        counters[1] += fields.nbytes
+        counters[2] += elapsed - callbackNs
+        counters[3] += callbackNs
+
+    def profile(self) -> dict:
+        """Returns messages, bytes, decoding and callback time (microseconds, total and per message)
+        by message type, the most expensive first
+        """
+
+        profile = {}
+        for msgId, (messages, nbytes, decodeNs, callbackNs) in sorted(
+            self.counters.items(), key=lambda item: -(item[1][2] + item[1][3])
+        ):
+            profile[MSG_NAMES.get(msgId, str(msgId))] = {
+                "messages": messages,
+                "bytes": nbytes,
+                "decodeUs": decodeNs / 1e3,
+                "callbackUs": callbackNs / 1e3,
+                "decodeUsPerMsg": decodeNs / messages / 1e3,
+                "callbackUsPerMsg": callbackNs / messages / 1e3,
+            }
+        return profile
+
+    def resetProfile(self) -> None:
+        self.counters.clear()
+
+    def specialize(self) -> None:
+        """
+        Builds the msgId -> HandleInfo table for the current serverVersion and installs it on this
+        instance in place of the class-level msgId2handleInfo.
+        Signature-driven messages get a generated handler, the heavy ones a specialized decoder.
+        This is called by IBProtocol as soon as the connection handshake gives us the server version.
+        """
+
+        table = dict(Decoder.msgId2handleInfo)
+        for msgId, handleInfo in table.items():
+            if handleInfo.wrapperMeth is not None and handleInfo.wrapperParams is not None:
+                table[msgId] = HandleInfo(proc=signatureHandler(self.wrapper, handleInfo))
+        for msgId, builder in SPECIALIZED_HANDLERS.items():
+            table[msgId] = HandleInfo(proc=builder(self.wrapper, self.serverVersion))
+        self.msgId2handleInfo = table
+
+        logger.debug(
+            f"Installed {len(table)} decoders specialized for server version {self.serverVersion}"
+        )
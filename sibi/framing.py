@@ -0,0 +1,115 @@
+from typing import Iterator, Optional, Union
+
+# Frames up to this size are split in one go when iterated, bigger ones chunk by chunk
+ITER_CHUNK_SIZE = 4096
+
+
+class FieldBuffer:
+    """Lazy, read-only view over the NUL separated fields of a TWS frame.
+
+    The frame is never split up front: NUL offsets are indexed on demand over the
+    receive buffer and a field is only copied out of it when a handler reads it.
+    It behaves like the tuple returned by the old ``split_fields``, so it supports
+    ``len()``, indexing, slicing and iteration, which is all ``Decoder.interpret``
+    and the ``process*Msg`` handlers need.
+
+    Args:
+        buffer (bytes): The receive buffer holding the frame
+        start (int): Offset of the first payload byte inside buffer
+        end (int): Offset right after the last payload byte (defaults to the buffer end)
+        separator (bytes): The field terminator
+    """
+
+    __slots__ = ("buffer", "start", "end", "separator", "_offsets", "_count")
+
+    def __init__(
+        self,
+        buffer: bytes,
+        start: int = 0,
+        end: Optional[int] = None,
+        separator: bytes = b"\0",
+    ) -> None:
+        self.buffer = buffer
+        self.start = start
+        self.end = len(buffer) if end is None else end
+        self.separator = separator
+        self._offsets = []
+        self._count = None
+
+    @property
+    def view(self) -> memoryview:
+        """ Zero-copy memoryview over the whole frame payload """
+
+        return memoryview(self.buffer)[self.start : self.end]
+
+    @property
+    def nbytes(self) -> int:
+        return self.end - self.start
+
+    def _terminator(self, index: int) -> int:
+        """ Returns the offset of the NUL closing field index, indexing lazily up to it """
+
+        offsets = self._offsets
+        indexed = len(offsets)
+        if index < indexed:
+            return offsets[index]
+
+        find = self.buffer.find
+        separator = self.separator
+        end = self.end
+        position = offsets[-1] + 1 if indexed else self.start
+        while indexed <= index:
+            offset = find(separator, position, end)
+            if offset < 0:
+                self._count = indexed
+                raise IndexError("field index out of range")
+            offsets.append(offset)
+            position = offset + 1
+            indexed += 1
+        return offset
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError("field index out of range")
+        end = self._terminator(index)
+        start = self._offsets[index - 1] + 1 if index else self.start
+        return self.buffer[start:end]
+
+    def __len__(self) -> int:
+        if self._count is None:
+            # Like bytes.split, a trailing chunk without terminator is not a field
+            self._count = self.buffer.count(self.separator, self.start, self.end)
+        return self._count
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.end - self.start <= ITER_CHUNK_SIZE:
+            fields = self.buffer[self.start : self.end].split(self.separator)
+            fields.pop()  # Last is always empty
+            return iter(fields)
+        return self._iter_chunks()
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        """
+        Walks big frames (historical data, contract details, ...) one chunk of whole fields at a time,
+        so a handler that stops early never pays for the rest of the frame.
+        """
+
+        buffer = self.buffer
+        separator = self.separator
+        end = self.end
+        position = self.start
+        while position < end:
+            stop = buffer.rfind(separator, position, min(position + ITER_CHUNK_SIZE, end))
+            if stop < 0:
+                stop = buffer.find(separator, position, end)
+                if stop < 0:
+                    return
+            yield from buffer[position:stop].split(separator)
+            position = stop + 1
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
@@ -0,0 +1,192 @@
+import json
+import math
+import re
+import time
+from datetime import datetime, timedelta, timezone as tz
+from typing import Iterable, List, Optional, Tuple
+
+from sibi.models import HistoricalBars
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9, named time zones are taken as local time
+    ZoneInfo = None
+
+UNIT_SECONDS = {"S": 1, "D": 86400, "W": 7 * 86400, "M": 31 * 86400, "Y": 365 * 86400}
+
+# Longest window (count, unit) IB accepts in one request for each bar size
+BAR_SIZE_WINDOWS = {
+    "1 sec": (1800, "S"),
+    "5 secs": (3600, "S"),
+    "10 secs": (14400, "S"),
+    "15 secs": (14400, "S"),
+    "30 secs": (28800, "S"),
+    "1 min": (1, "D"),
+    "2 mins": (2, "D"),
+    "3 mins": (7, "D"),
+    "5 mins": (7, "D"),
+    "10 mins": (7, "D"),
+    "15 mins": (7, "D"),
+    "20 mins": (7, "D"),
+    "30 mins": (28, "D"),
+    "1 hour": (28, "D"),
+    "2 hours": (28, "D"),
+    "3 hours": (28, "D"),
+    "4 hours": (28, "D"),
+    "8 hours": (28, "D"),
+    "1 day": (365, "D"),
+}
+
+END_DATE_TIME = re.compile(r"^(\d{8})([ -])(\d{2}:\d{2}:\d{2})(?:\s+(\S+))?$")
+
+# Returned by TWS (error 162) for windows without any bar, eg. weekends and holidays
+NO_DATA = "returned no data"
+
+
+def durationSeconds(durationStr: str) -> int:
+    """ Converts an IB duration (eg. "3 Y", "3600 S") to seconds, a month being 31 days """
+
+    count, _, unit = durationStr.strip().partition(" ")
+    return int(count) * UNIT_SECONDS[(unit or "S").upper()]
+
+
+def barSeconds(barSizeSetting: str) -> int:
+    """ Length of a bar in seconds (eg. "5 mins" -> 300) """
+
+    count, _, unit = barSizeSetting.partition(" ")
+    unit = unit.rstrip("s")
+    return int(count) * {"sec": 1, "min": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}.get(
+        unit, 31 * 86400
+    )
+
+
+def toEpoch(dateTime: str, now: Optional[float] = None) -> float:
+    """Converts an endDateTime or a bar date returned by TWS to epoch seconds.
+
+    Handles "yyyymmdd", "yyyymmdd HH:mm:ss [zone]", "yyyymmdd-HH:mm:ss" (UTC) and epoch seconds
+    (formatDate=2). Times without a zone are local. "" is now.
+    """
+
+    dateTime = dateTime.strip()
+    if not dateTime:
+        return time.time() if now is None else now
+    if dateTime.isdigit() and len(dateTime) > 8:
+        return float(dateTime)
+    if len(dateTime) == 8:
+        return time.mktime(datetime.strptime(dateTime, "%Y%m%d").timetuple())
+
+    match = END_DATE_TIME.match(dateTime) or END_DATE_TIME.match(" ".join(dateTime.split()))
+    if match is None:
+        raise ValueError(f"Unsupported date {dateTime!r}")
+    day, separator, clock, zone = match.groups()
+    parsed = datetime.strptime(f"{day} {clock}", "%Y%m%d %H:%M:%S")
+    if separator == "-":
+        return parsed.replace(tzinfo=tz.utc).timestamp()
+    if zone and ZoneInfo is not None:
+        try:
+            return parsed.replace(tzinfo=ZoneInfo(zone)).timestamp()
+        except (KeyError, ValueError):
+            pass
+    return time.mktime(parsed.timetuple())
+
+
+def fromEpoch(timestamp: float) -> str:
+    """ Formats epoch seconds as a local endDateTime """
+
+    return datetime.fromtimestamp(timestamp).strftime("%Y%m%d %H:%M:%S")
+
+
+def durationFor(seconds: float, barSizeSetting: str) -> str:
+    """Shortest IB durationStr covering seconds, in seconds up to a day and in days above.
+    Daily (or longer) bars are always asked in days, at least "1 D"
+    """
+
+    if seconds <= 86400 and barSeconds(barSizeSetting) < 86400:
+        return f"{max(1, math.ceil(seconds))} S"
+    return f"{max(1, math.ceil(seconds / 86400))} D"
+
+
+def planChunks(
+    endDateTime: str, durationStr: str, barSizeSetting: str, now: Optional[datetime] = None
+) -> List[Tuple[str, str]]:
+    """Splits a historical request into windows IB accepts for barSizeSetting, newest first.
+
+    An empty endDateTime (now, on TWS' side) stays empty for the first chunk, the older ones end
+    at the local time minus their offset.
+
+    Returns:
+        list: (endDateTime, durationStr) of every chunk, just [(endDateTime, durationStr)] when
+            the request doesn't need splitting
+    """
+
+    window = BAR_SIZE_WINDOWS.get(barSizeSetting)
+    if window is None:
+        return [(endDateTime, durationStr)]
+
+    count, unit = window
+    unitSeconds = UNIT_SECONDS[unit]
+    step = count * unitSeconds
+    total = durationSeconds(durationStr)
+    if total <= step:
+        return [(endDateTime, durationStr)]
+
+    if endDateTime:
+        match = END_DATE_TIME.match(endDateTime.strip())
+        if match is None:
+            raise ValueError(f"Unsupported endDateTime {endDateTime!r}")
+        day, separator, clock, timezone = match.groups()
+        end = datetime.strptime(f"{day} {clock}", "%Y%m%d %H:%M:%S")
+    else:
+        separator, timezone = " ", None
+        end = (now or datetime.now()).replace(microsecond=0)
+
+    suffix = f" {timezone}" if timezone else ""
+    chunks = []
+    for index in range(math.ceil(total / step)):
+        chunkEnd = end - timedelta(seconds=index * step)
+        remaining = min(step, total - index * step)
+        if index == 0 and not endDateTime:
+            chunkEndDateTime = ""
+        else:
+            chunkEndDateTime = chunkEnd.strftime(f"%Y%m%d{separator}%H:%M:%S") + suffix
+        chunks.append((chunkEndDateTime, f"{math.ceil(remaining / unitSeconds)} {unit}"))
+    return chunks
+
+
+def _dateKey(date: str) -> Tuple[int, str]:
+    # Same format across chunks, so length then text orders both epochs (formatDate=2) and dates
+    return len(date), date
+
+
+def stitch(chunks: Iterable[HistoricalBars]) -> HistoricalBars:
+    """ Merges the bars of overlapping chunks into one series ordered by date, without duplicates """
+
+    merged = HistoricalBars()
+    for bars in chunks:
+        merged.extend(bars)
+
+    latest = {}
+    for index, date in enumerate(merged.date):
+        latest[date] = index
+    order = sorted(latest.values(), key=lambda index: _dateKey(merged.date[index]))
+    return merged.take(order)
+
+
+def stitchResults(results: List[str], columnar: bool = False) -> str:
+    """Stitches the JSON results of chunked (columnar) historical requests.
+
+    Chunks failing because there's no data in their window count as empty, any other error is
+    returned as the result of the whole request.
+    """
+
+    chunks = []
+    for result in results:
+        data = json.loads(result)
+        if "code" in data and "message" in data:
+            if NO_DATA in str(data["message"]):
+                continue
+            return result
+        chunks.append(HistoricalBars.from_dict(data))
+
+    bars = stitch(chunks)
+    return json.dumps(bars.to_dict() if columnar else bars.to_rows())
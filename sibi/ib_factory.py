@@ -1,51 +1,203 @@
+import json
+import time
+from functools import partial
+from typing import Iterable, List, Union
+
 from loguru import logger
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, DeferredSemaphore, gatherResults, succeed
 from twisted.internet.protocol import ReconnectingClientFactory
+from twisted.internet.task import LoopingCall
 from twisted.internet.tcp import Connector
 from twisted.python.failure import Failure
 
-from sibi.decorators import append, publish, request, resolve
+from sibi.bar_cache import HistoricalBarCache
+from sibi.conflation import TickConflator
+from sibi.contract_cache import ContractCache, queryContract, queryKey
+from sibi.contract_master import ContractMaster
+from sibi.decorators import append, coalesce, payloadTemplate, publish, request, resolve
+from sibi.encoder import RequestEncoder
 from sibi.exceptions import IBException
+from sibi.fast_decoder import FastDecoder
+from sibi.history import (
+    NO_DATA,
+    barSeconds,
+    durationFor,
+    durationSeconds,
+    fromEpoch,
+    planChunks,
+    stitchResults,
+    toEpoch,
+)
 from sibi.ib_protocol import IBProtocol
-from sibi.ibapi import decoder
 from sibi.ibapi.client import EClient
+from sibi.ibapi.comm import make_msg
 from sibi.ibapi.common import TickerId, BarData, TagValueList, TickAttrib, OrderId
 from sibi.ibapi.contract import Contract, ContractDetails
+from sibi.ibapi.errors import NOT_CONNECTED
 from sibi.ibapi.order import Order
 from sibi.ibapi.order_state import OrderState
-from sibi.ibapi.ticktype import TickType, TickTypeEnum
+from sibi.ibapi.ticktype import TickType
 from sibi.ibapi.wrapper import EWrapper
-from sibi.models import OrderStatus
+from sibi.latency import LatencyStats
+from sibi.models import HistoricalBars, OrderStatus
+from sibi.pacing import HistoricalPacer, historicalKeys
+from sibi.publisher import RedisPublisher
+from sibi.quotes import QuoteTable
+from sibi.scheduler import OutboundScheduler
+from sibi.shm import ShmTickWriter
+from sibi.subscriptions import SubscriptionRegistry, subscriptionKey
+from sibi.ticks import (
+    GENERIC,
+    OPTION,
+    OPTION_FIELDS,
+    PRICE,
+    SIZE,
+    STRING,
+    RedisSink,
+    ShmSink,
+    TickPipeline,
+)
 
 
 class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
     protocol = IBProtocol
 
-    def __init__(self, clientId: int) -> None:
+    def __init__(
+        self,
+        clientId: int,
+        coalesceWrites: bool = False,
+        coalesceWindow: float = 0,
+        maxMsgRate: float = 40,
+        msgBurst: int = 10,
+        historicalCachePath: str = None,
+        historicalCacheMaxBars: int = 10_000_000,
+        contractCacheSize: int = 50_000,
+        contractCacheTTL: float = 86400,
+        contractMasterPath: str = None,
+        contractRefreshInterval: float = 60,
+        contractRefreshBatch: int = 20,
+        tickConflation: float = 0,
+        tickPassthrough: bool = True,
+        publisher: RedisPublisher = None,
+        wireFormats: dict = None,
+        tickRing: ShmTickWriter = None,
+        redisTickTypes: Iterable[int] = None,
+        shmTickTypes: Iterable[int] = None,
+    ) -> None:
         """This is the Factory that instantiates the IBProtocols instance.
 
         Args:
             clientId (int): The clientId for TWS
+            coalesceWrites (bool): Collect outgoing frames and write them to TWS in batches
+            coalesceWindow (float): How long (seconds) frames are collected, 0 means one reactor iteration
+            maxMsgRate (float): Sustained messages per second sent to TWS
+            msgBurst (int): Messages that can be sent back to back before pacing kicks in
+            historicalCachePath (str): sqlite file caching historical bars, no cache if None
+            historicalCacheMaxBars (int): How many bars the historical cache holds at most
+            contractCacheSize (int): How many contract details answers are kept in memory
+            contractCacheTTL (float): Seconds a contract details answer is served from memory
+            contractMasterPath (str): sqlite file storing contract details answers across restarts
+            contractRefreshInterval (float): Seconds between two background refreshes of the contract master
+            contractRefreshBatch (int): How many stale contract queries are sent to TWS per refresh
+            tickConflation (float): If set, seconds between two tick snapshots published on tickSnapshot
+            tickPassthrough (bool): Publish every tick on its channel (tickPrice, tickSize...)
+            publisher (RedisPublisher): Where events are published, defaults to Redis on localhost
+            wireFormats (dict): sibi.wire formats replacing JSON, by channel (see sibi.wire.parseWireFormats)
+            tickRing (ShmTickWriter): Shared memory ring numeric ticks are also written to
+            redisTickTypes (Iterable[int]): Tick types published one by one, every one if None
+            shmTickTypes (Iterable[int]): Tick types written to tickRing, every one if None
         """
         EClient.__init__(self, wrapper=self)
         self.name = "IBClientFactory"
-        self.decoder = decoder.Decoder(self, self.serverVersion())
+        self.decoder = FastDecoder(self, self.serverVersion())
+        self.encoder = RequestEncoder()
+        self.historicalPacer = HistoricalPacer()
+        self.scheduler = OutboundScheduler(
+            self.writeFrame, maxMsgRate, msgBurst, onSent=self.historicalPacer.sent
+        )
+        self.sendingReqId = None  # Request being encoded by an EClient method, see sendRequest
+        self.historicalCache = (
+            HistoricalBarCache(historicalCachePath, historicalCacheMaxBars)
+            if historicalCachePath
+            else None
+        )
         self.clientId = clientId
+        self.coalesceWrites = coalesceWrites
+        self.coalesceWindow = coalesceWindow
         self.currentReqId = 1
         self.nextValidOrderId = -1
         self.deferredRequests = {}
         self.deferredResults = {}
         self.additionalRequestInfo = {}
+        self.additionalRequestPayloads = {}
+        self.columnarRequests = set()
+        self.inflightRequests = {}
+        self.contractCache = ContractCache(contractCacheSize, contractCacheTTL)
+        self.pendingContractQueries = {}
+        self.contractMaster = None
+        self.contractRefreshBatch = contractRefreshBatch
+        if contractMasterPath:
+            self.contractMaster = ContractMaster(contractMasterPath)
+            self.contractMaster.preload(self.contractCache)
+            self.contractRefresh = LoopingCall(self.refreshContracts)
+            self.contractRefresh.start(contractRefreshInterval, now=False)
 
         self.deferredOrdersRequests = {}
         self.deferredOrdersResults = {}
         self.additionalOrderInfo = {}
-        self.activeMktDataSubscriptions = []
+        self.additionalOrderPayloads = {}
+        self.mktDataSubscriptions = SubscriptionRegistry()
+        self.quotes = QuoteTable()
+        self.publisher = RedisPublisher() if publisher is None else publisher
+        self.wireFormats = {} if wireFormats is None else wireFormats
+        self.receivedAt = None  # Receive time of the frame being decoded, set by IBProtocol
+        self.latency = LatencyStats()
+        self.ticks = TickPipeline(latency=self.latency["decode"])
+        self.ticks.add(self.quotes)
+        if tickRing is not None:
+            self.ticks.add(ShmSink(tickRing, shmTickTypes))
+        self.conflator = None
+        if tickConflation:
+            self.conflator = self.ticks.add(
+                TickConflator(
+                    self.publishMessage,
+                    tickConflation,
+                    self.additionalRequestInfo,
+                    wireFormat=self.wireFormats.get("tickSnapshot"),
+                )
+            )
+            self.conflator.start()
+        if self.conflator is None or tickPassthrough:
+            self.ticks.add(
+                RedisSink(
+                    self.publishMessage,
+                    self.additionalRequestInfo,
+                    self.additionalRequestPayloads,
+                    self.wireFormats,
+                    redisTickTypes,
+                )
+            )
 
     def clientConnectionLost(self, connector: Connector, reason: Failure) -> None:
         """ Internal reconnection method in case of connection lose """
 
         logger.warning(f"Lost connection.  Reason: {reason.getErrorMessage()}")
+        # Requests still queued by the scheduler never reached TWS, nobody would answer them
+        for reqId in self.scheduler.clear():
+            self.error(reqId, NOT_CONNECTED.code(), NOT_CONNECTED.msg())
+        # TWS doesn't restore market data lines on reconnection
+        for reqId in self.mktDataSubscriptions.clear():
+            self.forgetRequestInfo(reqId)
+        self.quotes.clear()
+        # Historical requests still held back by pacing never reached TWS, nobody would answer them
+        for reqId in self.historicalPacer.clear():
+            self.error(reqId, NOT_CONNECTED.code(), NOT_CONNECTED.msg())
+        # Nor will requests in flight be answered after reconnecting: fail them, so that identical
+        # requests coalesced with them don't wait forever
+        for reqId in list(self.deferredRequests):
+            self.error(reqId, NOT_CONNECTED.code(), NOT_CONNECTED.msg())
+        self.deferredResults.clear()
+        self.inflightRequests.clear()
         ReconnectingClientFactory.clientConnectionLost(self, connector, reason)
 
     def clientConnectionFailed(self, connector: Connector, reason: Failure) -> None:
@@ -54,6 +206,49 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         logger.warning(f"Connection failed.  Reason: {reason.getErrorMessage()}")
         ReconnectingClientFactory.clientConnectionFailed(self, connector, reason)
 
+    def sendRequest(self, name: str, *args) -> None:
+        """Sends the EClient request name through the pre-encoded templates of RequestEncoder,
+        falling back to the EClient implementation when the templates can't encode it
+        """
+
+        # Orders are keyed by orderId and resolved once sent, nothing waits for their frame
+        reqId = None if name == "placeOrder" else args[0]
+        frame = getattr(self.encoder, name)(*args) if self.isConnected() else None
+        if frame is None:
+            self.sendingReqId = reqId
+            try:
+                getattr(EClient, name)(self, *args)
+            finally:
+                self.sendingReqId = None
+        else:
+            self.scheduler.submit(frame, reqId=reqId)
+
+    def sendMsg(self, msg: str) -> None:
+        """ Overrides EClient.sendMsg so every request goes through the outbound scheduler """
+
+        self.scheduler.submit(make_msg(msg), reqId=self.sendingReqId)
+
+    def writeFrame(self, frame: bytes) -> None:
+        """ Writes a frame released by the scheduler to TWS """
+
+        if self.isConnected():
+            self.conn.sendMsg(frame)
+        else:
+            logger.warning("Not connected, dropping request")
+
+    def publishMessage(self, channel: str, message: Union[str, bytes]) -> None:
+        """ Publishes message on the Redis channel, without blocking """
+
+        if self.receivedAt is not None:
+            self.latency["publish"].since(self.receivedAt)
+        self.publisher.publish(channel, message)
+
+    def forgetRequestInfo(self, reqId: int) -> None:
+        """ Drops the fields merged into the published events of reqId """
+
+        self.additionalRequestInfo.pop(reqId, None)
+        self.additionalRequestPayloads.pop(reqId, None)
+
     def getNextReqId(self) -> int:
         """  Increments the reqId for TWS. This is automatically called by **@request** decorator """
 
@@ -83,7 +278,7 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         concerning the order's activity via **openOrder** and **orderStatus** methods
         """
 
-        super(IBClientFactory, self).placeOrder(orderId, contract, order)
+        self.sendRequest("placeOrder", orderId, contract, order)
         self.deferredOrdersResults[orderId] = {"orderId": orderId}
         return self.deferredOrdersRequests[orderId]
 
@@ -138,13 +333,74 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         )
         return orderStatus.__dict__
 
+    def reqContractDetails(self, contract: Contract, **kwargs) -> Deferred:
+        """ Returns the contract details matching contract, from contractCache when possible """
+
+        cached = self.contractCache.get(contract)
+        if cached is not None:
+            return succeed(json.dumps(cached))
+        return self.fetchContractDetails(contract, **kwargs)
+
+    def reqContractDetailsBatch(self, contracts: List[Contract], concurrency: int = 50) -> Deferred:
+        """Resolves many contracts at once, at most concurrency of them in flight with TWS.
+
+        Returns:
+            Deferred: Fires with the JSON list of {"result": [contract, ...]} or {"error": {...}},
+                one per contract, in the same order
+        """
+
+        semaphore = DeferredSemaphore(concurrency)
+
+        def item(result):
+            data = json.loads(result)
+            return {"error": data} if isinstance(data, dict) else {"result": data}
+
+        requests = [
+            semaphore.run(self.reqContractDetails, contract).addCallback(item)
+            for contract in contracts
+        ]
+        return gatherResults(requests).addCallback(json.dumps)
+
+    @coalesce
     @request
-    def reqContractDetails(self, reqId: int, contract: Contract, **kwargs) -> Deferred:
+    def fetchContractDetails(self, reqId: int, contract: Contract, **kwargs) -> Deferred:
+        """ Requests the contract details to TWS, the answer is added to contractCache """
+
         logger.debug(contract.__dict__)
 
-        super(IBClientFactory, self).reqContractDetails(reqId, contract)
+        self.pendingContractQueries[reqId] = queryKey(contract)
+        self.sendRequest("reqContractDetails", reqId, contract)
         return self.deferredRequests[reqId]
 
+    def refreshContracts(self) -> None:
+        """ Asks TWS again the contract master queries answered more than half contractCache TTL ago """
+
+        if not self.isConnected():
+            return
+        olderThan = time.time() - self.contractCache.ttl / 2
+        master = self.contractMaster
+        master.defer(master.stale, olderThan, self.contractRefreshBatch).addCallback(
+            self.refreshStaleContracts
+        ).addErrback(self.contractMasterFailed)
+
+    def refreshStaleContracts(self, stale: List[tuple]) -> None:
+        for key, updatedAt in stale:
+            logger.debug(f"Refreshing contract query {key}")
+            self.fetchContractDetails(queryContract(key)).addCallback(self.contractRefreshed, key)
+
+    def contractRefreshed(self, result: str, key: tuple) -> str:
+        data = json.loads(result)
+        if isinstance(data, dict) and data.get("code") == 200:
+            # No security definition: the contracts expired
+            self.contractMaster.defer(self.contractMaster.delete, key).addErrback(
+                self.contractMasterFailed
+            )
+        return result
+
+    def contractMasterFailed(self, failure: Failure) -> None:
+        logger.error(f"Contract master failure: {failure.getErrorMessage()}")
+
+    @coalesce
     @request
     def reqHistoricalData(
         self,
@@ -158,11 +414,32 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         formatDate: int,
         keepUpToDate: bool,
         chartOptions: TagValueList,
+        columnar: bool = False,
         **kwargs,
     ) -> Deferred:
-        """ Requests historical data for contract. """
+        """Requests historical data for contract.
+
+        If columnar is set, bars are returned as a dict of columns (date, open, high, ...)
+        instead of a list of bar dicts.
+        The request is held back by HistoricalPacer until sending it can't cause a pacing violation.
+        """
+
+        if columnar:
+            self.columnarRequests.add(reqId)
 
-        super(IBClientFactory, self).reqHistoricalData(
+        identicalKey, burstKey = historicalKeys(
+            contract,
+            endDateTime,
+            durationStr,
+            barSizeSetting,
+            whatToShow,
+            useRTH,
+            formatDate,
+            keepUpToDate,
+        )
+        send = partial(
+            self.sendRequest,
+            "reqHistoricalData",
             reqId,
             contract,
             endDateTime,
@@ -174,12 +451,167 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
             keepUpToDate,
             chartOptions,
         )
+        self.historicalPacer.submit(reqId, identicalKey, burstKey, send)
 
         return self.deferredRequests[reqId]
 
+    def cancelHistoricalData(self, reqId: TickerId) -> None:
+        """ Cancels historical request reqId, at TWS or, if pacing still holds it back, in the queue """
+
+        if self.historicalPacer.cancel(reqId):
+            # Never sent: answer it the way TWS answers a cancelled query
+            self.error(
+                reqId,
+                162,
+                f"Historical Market Data Service error message:API historical data query cancelled: {reqId}",
+            )
+        else:
+            super(IBClientFactory, self).cancelHistoricalData(reqId)
+
+    def reqHistoricalDataChunked(
+        self,
+        contract: Contract,
+        endDateTime: str,
+        durationStr: str,
+        barSizeSetting: str,
+        whatToShow: str,
+        useRTH: int,
+        formatDate: int,
+        chartOptions: TagValueList = None,
+        columnar: bool = False,
+    ) -> Deferred:
+        """Requests historical data over any duration, splitting it into windows IB accepts for
+        barSizeSetting. Chunks run concurrently (as far as HistoricalPacer allows) and their bars are
+        stitched into one series ordered by date. Requests fitting in one window are sent unchanged.
+        """
+
+        chunks = planChunks(endDateTime, durationStr, barSizeSetting)
+        if len(chunks) == 1:
+            return self.reqHistoricalData(
+                contract,
+                endDateTime,
+                durationStr,
+                barSizeSetting,
+                whatToShow,
+                useRTH,
+                formatDate,
+                False,
+                chartOptions or [],
+                columnar,
+            )
+        logger.info(f"Requesting {durationStr} of {barSizeSetting} bars in {len(chunks)} chunks")
+        requests = [
+            self.reqHistoricalData(
+                contract,
+                chunkEndDateTime,
+                chunkDurationStr,
+                barSizeSetting,
+                whatToShow,
+                useRTH,
+                formatDate,
+                False,
+                chartOptions or [],
+                True,
+            )
+            for chunkEndDateTime, chunkDurationStr in chunks
+        ]
+        return gatherResults(requests).addCallback(stitchResults, columnar)
+
+    def reqHistoricalDataCached(
+        self,
+        contract: Contract,
+        endDateTime: str,
+        durationStr: str,
+        barSizeSetting: str,
+        whatToShow: str,
+        useRTH: int,
+        formatDate: int,
+        chartOptions: TagValueList = None,
+        columnar: bool = False,
+    ) -> Deferred:
+        """Like reqHistoricalDataChunked, but serves bars from historicalCache and only asks TWS for
+        the time ranges it doesn't hold yet. Times without a zone are taken in the local time zone,
+        which has to be the one of TWS.
+        """
+
+        cache = self.historicalCache
+        key = cache.seriesKey(contract, barSizeSetting, whatToShow, useRTH, formatDate)
+        now = time.time()
+        end = toEpoch(endDateTime, now)
+        start = end - durationSeconds(durationStr)
+
+        def fill(gaps, results):
+            """ Runs in the cache worker thread """
+
+            for (gapStart, gapEnd), result in zip(gaps, results):
+                data = json.loads(result)
+                if "code" in data and "message" in data:
+                    if NO_DATA not in str(data["message"]):
+                        return result
+                    bars = HistoricalBars()
+                else:
+                    bars = HistoricalBars.from_dict(data)
+                if gapEnd > now - barSeconds(barSizeSetting):
+                    # The last bar is still forming: leave it out of the coverage so it's fetched again
+                    gapEnd = toEpoch(bars.date[-1]) if len(bars) else gapStart
+                cache.store(key, bars, gapStart, gapEnd)
+
+            bars = cache.load(key, start, end)
+            return json.dumps(bars.to_dict() if columnar else bars.to_rows())
+
+        def requestGaps(gaps):
+            logger.debug(f"Historical cache gaps for {key}: {gaps}")
+            requests = [
+                self.reqHistoricalDataChunked(
+                    contract,
+                    fromEpoch(gapEnd),
+                    durationFor(gapEnd - gapStart, barSizeSetting),
+                    barSizeSetting,
+                    whatToShow,
+                    useRTH,
+                    formatDate,
+                    chartOptions,
+                    True,
+                )
+                for gapStart, gapEnd in gaps
+            ]
+            return gatherResults(requests).addCallback(
+                lambda results: cache.defer(fill, gaps, results)
+            )
+
+        return cache.defer(cache.gaps, key, start, end).addCallback(requestGaps)
+
+    def reqMktData(
+        self,
+        contract: Contract,
+        genericTickList: str = "",
+        snapshot: bool = False,
+        regulatorySnapshot: bool = False,
+        mktDataOptions=None,
+        **kwargs,
+    ) -> Deferred:
+        """Starts live market data polling for specified contract.
+
+        Streaming requests for a contract (and genericTickList) already streamed share its line and reqId.
+        """
+
+        if not snapshot and not regulatorySnapshot:
+            subscription = self.mktDataSubscriptions.acquire(
+                subscriptionKey(contract, genericTickList)
+            )
+            if subscription is not None:
+                logger.debug(
+                    f"Sharing market data line {subscription.reqId} ({subscription.subscribers} subscribers)"
+                )
+                return succeed(json.dumps({"reqId": subscription.reqId}))
+
+        return self.openMktData(
+            contract, genericTickList, snapshot, regulatorySnapshot, mktDataOptions, **kwargs
+        )
+
     @request
     @resolve
-    def reqMktData(
+    def openMktData(
         self,
         reqId: int,
         contract: Contract,
@@ -189,12 +621,13 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         mktDataOptions=None,
         **kwargs,
     ) -> None:
-        """ Starts live market data polling for specified contract """
+        """ Opens a new market data line with TWS """
 
         if mktDataOptions is None:
             mktDataOptions = []
 
-        super(IBClientFactory, self).reqMktData(
+        self.sendRequest(
+            "reqMktData",
             reqId,
             contract,
             genericTickList,
@@ -203,30 +636,43 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
             mktDataOptions,
         )
         self.deferredResults[reqId] = {"reqId": reqId}
-        self.activeMktDataSubscriptions.append(reqId)
+        if not snapshot and not regulatorySnapshot:
+            self.mktDataSubscriptions.add(reqId, subscriptionKey(contract, genericTickList))
         self.additionalRequestInfo[reqId] = contract.__dict__
+        try:
+            self.additionalRequestPayloads[reqId] = payloadTemplate(contract.__dict__)
+        except TypeError:
+            # Not JSON serializable (eg. combo legs), events fall back to encoding the whole dict
+            pass
         return self.deferredRequests[reqId]
 
     @request
     @resolve
     def cancelMktData(self, reqId: int, tickerId: TickerId):
+        """ Unsubscribes from tickerId (every line if -1), its line is cancelled when it has no subscriber left """
+
         canceledIDs = []
         if tickerId == -1:
-            for _tickerId in self.activeMktDataSubscriptions:
-                super(IBClientFactory, self).cancelMktData(int(_tickerId))
+            for _tickerId in self.mktDataSubscriptions.clear():
+                super(IBClientFactory, self).cancelMktData(_tickerId)
+                self.forgetRequestInfo(_tickerId)
                 canceledIDs.append(_tickerId)
-            self.activeMktDataSubscriptions = []
+            self.quotes.clear()
             self.deferredResults[reqId] = {"reqId": canceledIDs}
         else:
-            super(IBClientFactory, self).cancelMktData(tickerId)
+            if self.mktDataSubscriptions.release(tickerId):
+                super(IBClientFactory, self).cancelMktData(tickerId)
+                self.forgetRequestInfo(tickerId)
+                self.quotes.remove(tickerId)
             self.deferredResults[reqId] = {"reqId": reqId}
         return self.deferredRequests[reqId]
 
-    @request(order=True)
-    @resolve(order=True)
-    def cancelOrder(self, orderId: OrderId):
-        # TODO: Test this
+    @request
+    @resolve
+    def cancelOrder(self, reqId: int, orderId: OrderId):
         super(IBClientFactory, self).cancelOrder(orderId)
+        self.deferredResults[reqId] = {"orderId": orderId}
+        return self.deferredRequests[reqId]
 
     @append
     def contractDetails(self, reqId: int, contractDetails: ContractDetails) -> dict:
@@ -238,43 +684,54 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
 
         return bar.__dict__
 
-    @publish
+    def historicalDataColumns(self, reqId: int, bars: HistoricalBars) -> None:
+        """ Collects the columns of a whole HISTORICAL_DATA message, as decoded by FastDecoder """
+
+        if reqId in self.deferredResults:
+            self.deferredResults[reqId].extend(bars)
+        else:
+            self.deferredResults[reqId] = bars
+        logger.debug(f"Collected {len(bars)} bars for {reqId}")
+
     def tickPrice(
         self, reqId: int, tickType: TickType, price: float, attrib: TickAttrib
-    ) -> dict:
+    ) -> None:
         """ This method is called by IB server when a new tickPrice is available for active live data market lines """
 
-        data = {
-            "reqId": reqId,
-            "tickType": TickTypeEnum.to_str(tickType),
-            "price": price,
-        }
+        self.ticks.emit(reqId, tickType, PRICE, price, self.receivedAt)
 
-        return data
+    def tickSize(self, reqId: int, tickType: TickType, size: int) -> None:
+        self.ticks.emit(reqId, tickType, SIZE, size, self.receivedAt)
 
-    def tickSize(self, reqId: int, tickType: TickType, size: int) -> dict:
-        data = {
-            "reqId": reqId,
-            "tickType": TickTypeEnum.to_str(tickType),
-            "size": size,
-        }
-        return data
+    def tickString(self, reqId: int, tickType: TickType, value: str) -> None:
+        self.ticks.emit(reqId, tickType, STRING, value, self.receivedAt)
 
-    def tickString(self, reqId: int, tickType: TickType, value: str) -> dict:
-        data = {
-            "reqId": reqId,
-            "tickType": TickTypeEnum.to_str(tickType),
-            "value": value,
-        }
-        return data
+    def tickGeneric(self, reqId: int, tickType: TickType, value: float) -> None:
+        self.ticks.emit(reqId, tickType, GENERIC, value, self.receivedAt)
 
-    def tickGeneric(self, reqId: int, tickType: TickType, value: float) -> dict:
-        data = {
-            "reqId": reqId,
-            "tickType": TickTypeEnum.to_str(tickType),
-            "value": value,
-        }
-        return data
+    def tickOptionComputation(
+        self,
+        reqId: int,
+        tickType: TickType,
+        impliedVol: float,
+        delta: float,
+        optPrice: float,
+        pvDividend: float,
+        gamma: float,
+        vega: float,
+        theta: float,
+        undPrice: float,
+    ) -> None:
+        values = (impliedVol, delta, optPrice, pvDividend, gamma, vega, theta, undPrice)
+        self.ticks.emit(
+            reqId, tickType, OPTION, dict(zip(OPTION_FIELDS, values)), self.receivedAt
+        )
+
+    def tickSnapshotEnd(self, reqId: int) -> None:
+        """ Snapshot lines are never cancelled, their end is the last message they get """
+
+        self.quotes.remove(reqId)
+        self.forgetRequestInfo(reqId)
 
     @publish
     def historicalDataUpdate(self, reqId: int, bar: BarData) -> dict:
@@ -283,11 +740,26 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
 
     @resolve
     def historicalDataEnd(self, reqId: int, start: str, end: str) -> None:
-        pass
+        bars = self.deferredResults.get(reqId)
+        if bars is None:
+            bars = HistoricalBars()
+        if isinstance(bars, HistoricalBars):
+            if reqId in self.columnarRequests:
+                self.deferredResults[reqId] = bars.to_dict()
+            else:
+                self.deferredResults[reqId] = bars.to_rows()
+        self.columnarRequests.discard(reqId)
 
     @resolve
     def contractDetailsEnd(self, reqId: int) -> None:
-        pass
+        contracts = self.deferredResults.setdefault(reqId, [])
+        query = self.pendingContractQueries.pop(reqId, None)
+        if query is not None:
+            self.contractCache.put(query, contracts)
+            if self.contractMaster is not None:
+                self.contractMaster.defer(self.contractMaster.save, query, contracts).addErrback(
+                    self.contractMasterFailed
+                )
 
     def error(
         self, reqId: TickerId, errorCode: int = -1, errorString: str = "GenericError"
@@ -298,6 +770,14 @@ class IBClientFactory(ReconnectingClientFactory, EClient, EWrapper):
         else:
             logger.error(f"Error. Id: {reqId} Code: {errorCode} Msg: {errorString}")
 
+        self.columnarRequests.discard(reqId)
+        self.pendingContractQueries.pop(reqId, None)
+        self.historicalPacer.cancel(reqId)
+        if reqId in self.mktDataSubscriptions and not 2100 <= errorCode < 2200 and errorCode != 10167:
+            # The line is dead (eg. no permissions), next requests for it have to reach TWS
+            self.mktDataSubscriptions.remove(reqId)
+            self.forgetRequestInfo(reqId)
+            self.quotes.remove(reqId)
         if reqId in self.deferredRequests.keys():
             self.deferredRequests[reqId].callback(
                 IBException(errorCode, errorString, reqId).__dict__
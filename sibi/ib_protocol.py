@@ -1,32 +1,123 @@
 import struct
+import time
 from typing import Optional
 
 from loguru import logger
+from twisted.internet import reactor
 from twisted.internet.protocol import connectionDone
 from twisted.protocols.basic import Int32StringReceiver
 from twisted.protocols.policies import TimeoutMixin
 
+from sibi.framing import FieldBuffer
+from sibi.ibapi.message import OUT
 from sibi.ibapi.server_versions import MIN_CLIENT_VER, MAX_CLIENT_VER
 
 PROTOCOL_TIMEOUT = 10
 (DISCONNECTED, CONNECTING, CONNECTED, REDIRECT) = range(4)
 
+# Frames starting with these message ids are never held back by write coalescing
+URGENT_MSG_PREFIXES = tuple(
+    b"%d\0" % msgId for msgId in (OUT.CANCEL_ORDER, OUT.REQ_GLOBAL_CANCEL)
+)
+
 
 class IBProtocol(Int32StringReceiver, TimeoutMixin):
+    clock = reactor
+
     def __init__(self):
         self.setTimeout(PROTOCOL_TIMEOUT)
+        self.pendingWrites = []
+        self.flushCall = None
 
     def sendMsg(self, msg):
+        """
+        Writes a length prefixed frame to TWS.
+        When the factory enables coalesceWrites, frames are collected and flushed together with a
+        single writeSequence, either at the next reactor iteration or after coalesceWindow seconds.
+        Urgent messages (eg. cancelOrder) flush whatever is pending and go out immediately.
+        """
+
+        if not self.factory.coalesceWrites or not self.isConnected():
+            self.setTimeout(PROTOCOL_TIMEOUT)
+            self.transport.write(msg)
+            return
+
+        self.pendingWrites.append(msg)
+        if msg.startswith(URGENT_MSG_PREFIXES, 4):
+            self.flushWrites()
+        elif self.flushCall is None:
+            self.flushCall = self.clock.callLater(
+                self.factory.coalesceWindow, self.flushWrites
+            )
+
+    def flushWrites(self):
+        """ Writes all the coalesced frames at once """
+
+        if self.flushCall is not None:
+            if self.flushCall.active():
+                self.flushCall.cancel()
+            self.flushCall = None
+        if not self.pendingWrites:
+            return
+
+        pendingWrites, self.pendingWrites = self.pendingWrites, []
         self.setTimeout(PROTOCOL_TIMEOUT)
-        self.transport.write(msg)
+        self.transport.writeSequence(pendingWrites)
+
+    def dataReceived(self, data):
+        """
+        Stamps the received frames with their receive time (time.monotonic_ns): it's in
+        factory.receivedAt while they are decoded, so wrapper callbacks can measure and publish it.
+        """
+        self.factory.receivedAt = time.monotonic_ns()
+        try:
+            self.framesReceived(data)
+        finally:
+            self.factory.receivedAt = None
+
+    def framesReceived(self, data):
+        """
+        Frames length prefixed messages straight out of the receive buffer.
+        Unlike Int32StringReceiver, no per-frame copy is made: every frame is handed over
+        as a FieldBuffer indexing the received bytes in place.
+        """
+        alldata = self._unprocessed + data
+        offset = 0
+        prefixLength = self.prefixLength
+        fmt = self.structFormat
+        self._unprocessed = alldata
+
+        while len(alldata) >= offset + prefixLength and not self.paused:
+            (length,) = struct.unpack_from(fmt, alldata, offset)
+            if length > self.MAX_LENGTH:
+                self._compatibilityOffset = offset
+                self.lengthLimitExceeded(length)
+                return
+            messageStart = offset + prefixLength
+            messageEnd = messageStart + length
+            if len(alldata) < messageEnd:
+                break
+
+            offset = messageEnd
+            self._compatibilityOffset = offset
+            self.fieldsReceived(FieldBuffer(alldata, messageStart, messageEnd))
+
+        self._unprocessed = alldata[offset:]
+        self._compatibilityOffset = 0
 
     def stringReceived(self, text):
+        self.factory.receivedAt = time.monotonic_ns()
+        try:
+            self.fieldsReceived(self.split_fields(text))
+        finally:
+            self.factory.receivedAt = None
+
+    def fieldsReceived(self, fields):
         self.setTimeout(None)
-        fields = self.split_fields(text)
 
         if self.factory.connState == CONNECTING:
             if len(fields) == 2:
-                logger.debug(f"Consolidating connection for {text}")
+                logger.debug(f"Consolidating connection for {fields}")
                 self.finalize_connection(fields)
             else:
                 logger.error(f"Error while connecting")
@@ -40,6 +131,10 @@ class IBProtocol(Int32StringReceiver, TimeoutMixin):
         """
 
         logger.warning("Closing connection")
+        if self.flushCall is not None and self.flushCall.active():
+            self.flushCall.cancel()
+        self.flushCall = None
+        self.pendingWrites = []
         if self.factory.connState == CONNECTING:
             logger.warning("Reconnecting")
 
@@ -80,21 +175,22 @@ class IBProtocol(Int32StringReceiver, TimeoutMixin):
         self.factory.connTime = conn_time
         self.factory.serverVersion_ = server_version
         self.factory.decoder.serverVersion = self.factory.serverVersion()
+        self.factory.decoder.specialize()
+        self.factory.encoder.specialize(server_version)
 
         logger.debug(f"{self.factory.name}: sent startApi")
         self.factory.setConnState(CONNECTED)
         self.factory.startApi()
 
     @staticmethod
-    def split_fields(buffer: bytes, separator: Optional[bytes] = b"\0") -> tuple:
+    def split_fields(buffer: bytes, separator: Optional[bytes] = b"\0") -> FieldBuffer:
         """
         Payload is made of fields terminated/separated by NULL chars.
-        We split the bytes using the null b"\0" separator and return a tuple containing fields.
+        Fields are not split up front: the returned FieldBuffer indexes the null b"\0" separators
+        lazily and only copies out the fields that are actually read.
         """
 
-        fields = buffer.split(separator)
-
-        return tuple(fields[:-1])  # Last is always empty
+        return FieldBuffer(buffer, separator=separator)
 
     @staticmethod
     def make_field(value: str) -> str:
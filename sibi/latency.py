@@ -0,0 +1,98 @@
+import time
+from typing import Dict, Optional
+
+# Exact buckets below this many nanoseconds, 4 buckets per power of 2 above
+LINEAR_BUCKETS = 8
+BUCKETS = 256
+
+
+def bucketOf(ns: int) -> int:
+    if ns < LINEAR_BUCKETS:
+        return ns if ns > 0 else 0
+    bits = ns.bit_length()
+    return min((bits - 2) * 4 + ((ns >> (bits - 3)) & 3), BUCKETS - 1)
+
+
+def bucketBound(index: int) -> int:
+    """ Upper bound (ns, exclusive) of a bucket """
+
+    if index < LINEAR_BUCKETS:
+        return index + 1
+    bits, sub = divmod(index, 4)
+    return (5 + sub) << (bits - 1)
+
+
+class LatencyHistogram:
+    """Histogram of latencies in nanoseconds, with 4 buckets per power of 2 (a 25% resolution)
+    so recording is a couple of integer operations.
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int) -> None:
+        self.counts[bucketOf(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def since(self, start: Optional[int]) -> None:
+        """ Records the time elapsed since start (time.monotonic_ns), if any """
+
+        if start is not None:
+            self.record(time.monotonic_ns() - start)
+
+    def percentile(self, p: float) -> int:
+        """ Upper bound (ns) of the bucket holding the p-th percentile """
+
+        if not self.count:
+            return 0
+        rank = self.count * p / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bucketBound(index), self.max)
+        return self.max
+
+    def stats(self) -> dict:
+        """ Count, and mean, percentiles and max in microseconds """
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / 1e3 if self.count else 0,
+            "p50": self.percentile(50) / 1e3,
+            "p90": self.percentile(90) / 1e3,
+            "p99": self.percentile(99) / 1e3,
+            "p999": self.percentile(99.9) / 1e3,
+            "max": self.max / 1e3,
+        }
+
+
+class LatencyStats:
+    """ Named latency histograms, created on first use """
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def __getitem__(self, name: str) -> LatencyHistogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+    def reset(self) -> None:
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def stats(self) -> dict:
+        return {name: histogram.stats() for name, histogram in self.histograms.items()}
@@ -26,13 +26,113 @@ def run(
     tws_max_connections: int = typer.Option(49, help="Max concurrent request to TWS"),
     xmlrpc_port: int = typer.Option(7080, help="XMLRPC interface exposed port"),
     log_level: str = typer.Option("DEBUG", help="Log level"),
+    coalesce_writes: bool = typer.Option(
+        False, help="Batch outgoing TWS messages into fewer socket writes"
+    ),
+    coalesce_window_us: int = typer.Option(
+        0, help="Coalescing window in microseconds (0 = one reactor iteration)"
+    ),
+    tws_max_msg_rate: float = typer.Option(
+        40, help="Sustained messages/sec sent to TWS (TWS disconnects above ~50)"
+    ),
+    tws_msg_burst: int = typer.Option(
+        10, help="Messages sent back to back before pacing kicks in"
+    ),
+    history_cache_path: str = typer.Option(
+        "", help="sqlite file caching historical bars (empty = no cache)"
+    ),
+    history_cache_max_bars: int = typer.Option(
+        10_000_000, help="Max bars kept in the historical cache"
+    ),
+    contract_cache_size: int = typer.Option(
+        50_000, help="Max contract details answers kept in memory"
+    ),
+    contract_cache_ttl: float = typer.Option(
+        86400, help="Seconds a contract details answer is served from memory"
+    ),
+    contract_master_path: str = typer.Option(
+        "", help="sqlite file keeping contract details across restarts (empty = none)"
+    ),
+    contract_refresh_interval: float = typer.Option(
+        60, help="Seconds between two background refreshes of the contract master"
+    ),
+    contract_refresh_batch: int = typer.Option(
+        20, help="Stale contract queries sent to TWS per contract master refresh"
+    ),
+    tick_conflation_ms: int = typer.Option(
+        0, help="Publish conflated tick snapshots on tickSnapshot every N ms (0 = off)"
+    ),
+    tick_passthrough: bool = typer.Option(
+        True, help="Publish every tick on its channel (tickPrice, tickSize...)"
+    ),
+    redis_host: str = typer.Option("localhost", help="Redis host events are published to"),
+    redis_port: int = typer.Option(6379, help="Redis port"),
+    redis_db: int = typer.Option(0, help="Redis database"),
+    redis_max_backlog: int = typer.Option(
+        100_000, help="Max messages waiting for Redis before dropping"
+    ),
+    redis_drop_policy: str = typer.Option(
+        "oldest", help="Messages dropped when the backlog is full (oldest/newest)"
+    ),
+    redis_mode: str = typer.Option(
+        "pubsub",
+        help="pubsub, streams (tickPrice, orderStatus and openOrder go to Redis streams) or both",
+    ),
+    redis_stream_maxlen: int = typer.Option(
+        100_000, help="Approximate length Redis streams are trimmed to"
+    ),
+    wire_format: str = typer.Option(
+        "json",
+        help="Format of tick channels: json, struct, msgpack or per channel (tickPrice=struct,tickSnapshot=msgpack)",
+    ),
+    shm_name: str = typer.Option(
+        "", help="Shared memory block numeric ticks are written to (sibi.shm.ShmTickReader), off if empty"
+    ),
+    shm_capacity: int = typer.Option(65536, help="How many ticks the shared memory ring holds"),
+    redis_tick_types: str = typer.Option(
+        "", help="Tick types published one by one (eg. BID,ASK,LAST), every one if empty"
+    ),
+    shm_tick_types: str = typer.Option(
+        "", help="Tick types written to the shared memory ring, every one if empty"
+    ),
 ):
     logger.configure(
         handlers=[
             {"sink": sys.stdout, "format": fmt, "level": log_level},
         ],
     )
-    server = Sibi(client_id, tws_host, tws_port, tws_max_connections, xmlrpc_port)
+    server = Sibi(
+        client_id,
+        tws_host,
+        tws_port,
+        tws_max_connections,
+        xmlrpc_port,
+        coalesce_writes=coalesce_writes,
+        coalesce_window_us=coalesce_window_us,
+        tws_max_msg_rate=tws_max_msg_rate,
+        tws_msg_burst=tws_msg_burst,
+        history_cache_path=history_cache_path or None,
+        history_cache_max_bars=history_cache_max_bars,
+        contract_cache_size=contract_cache_size,
+        contract_cache_ttl=contract_cache_ttl,
+        contract_master_path=contract_master_path or None,
+        contract_refresh_interval=contract_refresh_interval,
+        contract_refresh_batch=contract_refresh_batch,
+        tick_conflation_ms=tick_conflation_ms,
+        tick_passthrough=tick_passthrough,
+        redis_host=redis_host,
+        redis_port=redis_port,
+        redis_db=redis_db,
+        redis_max_backlog=redis_max_backlog,
+        redis_drop_policy=redis_drop_policy,
+        redis_mode=redis_mode,
+        redis_stream_maxlen=redis_stream_maxlen,
+        wire_format=wire_format,
+        shm_name=shm_name or None,
+        shm_capacity=shm_capacity,
+        redis_tick_types=redis_tick_types,
+        shm_tick_types=shm_tick_types,
+    )
 
     logger.info(f"Connecting to {tws_host}:{tws_port} (id: {client_id})")
     logger.info(f"XMLRPC Proxy will be exposed on http://localhost:{xmlrpc_port}")
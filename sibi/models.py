@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
+from typing import List
 
 
 @dataclass
@@ -14,3 +16,56 @@ class OrderStatus:
     clientId: int
     whyHeld: str
     mktCapPrice: float
+
+
+@dataclass
+class HistoricalBars:
+    """Historical bars of a request stored column by column, without any per-bar object."""
+
+    date: List[str] = field(default_factory=list)
+    open: array = field(default_factory=lambda: array("d"))
+    high: array = field(default_factory=lambda: array("d"))
+    low: array = field(default_factory=lambda: array("d"))
+    close: array = field(default_factory=lambda: array("d"))
+    volume: array = field(default_factory=lambda: array("q"))
+    barCount: array = field(default_factory=lambda: array("q"))
+    average: array = field(default_factory=lambda: array("d"))
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    def extend(self, other: "HistoricalBars") -> None:
+        for name in COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+
+    def take(self, indices: List[int]) -> "HistoricalBars":
+        """ New HistoricalBars holding the bars at indices, in that order """
+
+        bars = HistoricalBars()
+        for name in COLUMNS:
+            column = getattr(self, name)
+            getattr(bars, name).extend(column[index] for index in indices)
+        return bars
+
+    @classmethod
+    def from_dict(cls, columns: dict) -> "HistoricalBars":
+        """ Inverse of to_dict """
+
+        bars = cls()
+        for name in COLUMNS:
+            getattr(bars, name).extend(columns[name])
+        return bars
+
+    def to_dict(self) -> dict:
+        """ Columns as plain lists, ready to be JSON encoded """
+
+        return {name: list(getattr(self, name)) for name in COLUMNS}
+
+    def to_rows(self) -> List[dict]:
+        """ One dict per bar, with the same keys as BarData.__dict__ """
+
+        columns = [getattr(self, name) for name in COLUMNS]
+        return [dict(zip(COLUMNS, values)) for values in zip(*columns)]
+
+
+COLUMNS = tuple(HistoricalBars.__dataclass_fields__)
@@ -0,0 +1,263 @@
+from collections import deque
+from typing import Callable, Hashable, List, Tuple
+
+from loguru import logger
+from twisted.internet import reactor
+
+from sibi.ibapi.contract import Contract
+
+# Contract fields that identify "the same contract" for the pacing rules
+CONTRACT_KEY_FIELDS = (
+    "conId",
+    "symbol",
+    "secType",
+    "lastTradeDateOrContractMonth",
+    "strike",
+    "right",
+    "multiplier",
+    "exchange",
+    "primaryExchange",
+    "currency",
+    "localSymbol",
+)
+
+
+def historicalKeys(
+    contract: Contract,
+    endDateTime: str,
+    durationStr: str,
+    barSizeSetting: str,
+    whatToShow: str,
+    useRTH: int,
+    formatDate: int,
+    keepUpToDate: bool,
+) -> Tuple[Hashable, Hashable]:
+    """ Returns the (identical request, same contract/exchange/tickType) keys of a historical request """
+
+    contractKey = tuple(getattr(contract, field, None) for field in CONTRACT_KEY_FIELDS)
+    burstKey = (contractKey, whatToShow)
+    identicalKey = (
+        burstKey,
+        endDateTime,
+        durationStr,
+        barSizeSetting,
+        useRTH,
+        formatDate,
+        keepUpToDate,
+    )
+    return identicalKey, burstKey
+
+
+class HistoricalPacer:
+    """Holds historical data requests back until sending them can't break IB pacing rules:
+
+    * no identical request within 15 seconds
+    * at most 6 requests for the same contract, exchange and tick type within 2 seconds
+    * at most 60 requests within 10 minutes
+
+    BID_ASK requests count twice, as IB does. Requests go out in FIFO order, but one held back
+    by the first two (per contract) rules doesn't hold back requests for other contracts.
+
+    A request counts from when its frame is written to TWS (see sent): while the outbound
+    scheduler still holds a released request back, it counts as sent now.
+
+    Args:
+        clock: The reactor (or a twisted.internet.task.Clock)
+        margin (float): Seconds added to every window, to absorb the network delay
+    """
+
+    identicalWindow = 15
+    burstWindow = 2
+    burstLimit = 6
+    window = 600
+    limit = 60
+
+    def __init__(self, clock=reactor, margin: float = 0.25) -> None:
+        self.clock = clock
+        self.margin = margin
+        self.history = deque()  # [sentAt, identicalKey, burstKey, weight]
+        self.unsent = {}  # reqId -> history entry of a request released but not written yet
+        self.queue = []  # [reqId, identicalKey, burstKey, weight, send, queuedAt]
+        self.drainCall = None
+        self.delayed = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+
+    @staticmethod
+    def weightOf(burstKey) -> int:
+        return 2 if burstKey[1] == "BID_ASK" else 1
+
+    def _refresh(self, now: float) -> None:
+        # Requests released but not written yet can't reach TWS before now
+        for entry in self.unsent.values():
+            entry[0] = now
+
+    def _expire(self, history: deque, now: float) -> None:
+        horizon = now - self.window - self.margin
+        while history and history[0][0] <= horizon:
+            history.popleft()
+
+    def _delay(self, history, identicalKey, burstKey, weight, now: float) -> float:
+        """ Seconds until a request can be sent without violating any rule, given history """
+
+        delay = 0.0
+        margin = self.margin
+
+        # Global: at most limit (weighted) requests in window
+        used = sum(entry[3] for entry in history)
+        if used + weight > self.limit:
+            excess = used + weight - self.limit
+            for sentAt, _, _, entryWeight in history:
+                excess -= entryWeight
+                if excess <= 0:
+                    delay = max(delay, sentAt + self.window + margin - now)
+                    break
+
+        burst = []
+        for sentAt, entryIdenticalKey, entryBurstKey, entryWeight in history:
+            if entryIdenticalKey == identicalKey:
+                delay = max(delay, sentAt + self.identicalWindow + margin - now)
+            if entryBurstKey == burstKey and sentAt > now - self.burstWindow - margin:
+                burst.append((sentAt, entryWeight))
+
+        used = sum(entryWeight for _, entryWeight in burst)
+        if used + weight > self.burstLimit:
+            excess = used + weight - self.burstLimit
+            for sentAt, entryWeight in burst:
+                excess -= entryWeight
+                if excess <= 0:
+                    delay = max(delay, sentAt + self.burstWindow + margin - now)
+                    break
+
+        # Float slack, so a drain can't be rescheduled a hair before the window expires
+        return delay if delay > 1e-9 else 0.0
+
+    def _plan(self, history: deque, queue: list, now: float) -> List[Tuple[float, list]]:
+        """
+        Simulates the queue against history, returning (sendAt, entry) for each queued request.
+        history is updated in place.
+        """
+
+        planned = []
+        pending = list(queue)
+        while pending:
+            self._expire(history, now)
+            waiting = []
+            nextAt = None
+            for entry in pending:
+                _, identicalKey, burstKey, weight, _, _ = entry
+                delay = self._delay(history, identicalKey, burstKey, weight, now)
+                if delay <= 0:
+                    planned.append((now, entry))
+                    history.append((now, identicalKey, burstKey, weight))
+                else:
+                    waiting.append(entry)
+                    nextAt = now + delay if nextAt is None else min(nextAt, now + delay)
+            pending = waiting
+            if nextAt is not None:
+                now = nextAt
+        return planned
+
+    def submit(self, reqId: int, identicalKey, burstKey, send: Callable[[], None]) -> None:
+        """ Sends a historical request through send as soon as pacing rules allow it """
+
+        self.queue.append(
+            [reqId, identicalKey, burstKey, self.weightOf(burstKey), send, self.clock.seconds()]
+        )
+        if self.drainCall is not None and self.drainCall.active():
+            self.drainCall.cancel()
+        self.drain()
+        if self.queue and self.queue[-1][0] == reqId:
+            logger.info(f"Historical request {reqId} held back by pacing rules")
+
+    def drain(self) -> None:
+        """ Sends every queued request that is allowed now, then reschedules itself """
+
+        self.drainCall = None
+        now = self.clock.seconds()
+        self._refresh(now)
+        self._expire(self.history, now)
+        waiting = []
+        for entry in self.queue:
+            reqId, identicalKey, burstKey, weight, send, queuedAt = entry
+            if self._delay(self.history, identicalKey, burstKey, weight, now) > 0:
+                waiting.append(entry)
+                continue
+            sentEntry = [now, identicalKey, burstKey, weight]
+            self.history.append(sentEntry)
+            self.unsent[reqId] = sentEntry
+            wait = now - queuedAt
+            if wait > 0:
+                self.delayed += 1
+                self.totalWait += wait
+                self.maxWait = max(self.maxWait, wait)
+            send()
+        self.queue = waiting
+
+        if self.queue:
+            nextDelay = min(
+                self._delay(self.history, identicalKey, burstKey, weight, now)
+                for _, identicalKey, burstKey, weight, _, _ in self.queue
+            )
+            self.drainCall = self.clock.callLater(nextDelay, self.drain)
+
+    def sent(self, reqId: int) -> None:
+        """ Called when the frame of reqId is written to TWS, where its pacing windows start """
+
+        entry = self.unsent.pop(reqId, None)
+        if entry is not None:
+            entry[0] = self.clock.seconds()
+
+    def cancel(self, reqId: int) -> bool:
+        """ Drops reqId from the queue, returns False if it was already sent """
+
+        for entry in self.queue:
+            if entry[0] == reqId:
+                self.queue.remove(entry)
+                return True
+        return False
+
+    def clear(self) -> List[int]:
+        """ Drops every queued request (eg. when the TWS connection is lost), returns their reqIds """
+
+        reqIds = [entry[0] for entry in self.queue]
+        self.queue = []
+        # Their frames are dropped too, the history keeps them as sent when last seen
+        self.unsent.clear()
+        if self.drainCall is not None and self.drainCall.active():
+            self.drainCall.cancel()
+        self.drainCall = None
+        if reqIds:
+            logger.warning(f"Dropped {len(reqIds)} historical requests held back by pacing rules")
+        return reqIds
+
+    def expectedWaits(self) -> dict:
+        """ Expected wait (seconds) of every queued request, by reqId """
+
+        now = self.clock.seconds()
+        self._refresh(now)
+        planned = self._plan(deque(self.history), self.queue, now)
+        return {entry[0]: sendAt - now for sendAt, entry in planned}
+
+    def nextSlot(self) -> float:
+        """ Expected wait of a new request for a contract with nothing queued or recently sent """
+
+        now = self.clock.seconds()
+        self._refresh(now)
+        probe = [None, object(), (object(), None), 1, None, now]
+        planned = self._plan(deque(self.history), self.queue + [probe], now)
+        return next(sendAt - now for sendAt, entry in planned if entry is probe)
+
+    def stats(self) -> dict:
+        now = self.clock.seconds()
+        self._expire(self.history, now)
+        return {
+            "queued": len(self.queue),
+            "expectedWaits": self.expectedWaits(),
+            "nextSlot": self.nextSlot(),
+            "windowUsed": sum(entry[3] for entry in self.history),
+            "windowLimit": self.limit,
+            "delayed": self.delayed,
+            "avgWait": self.totalWait / self.delayed if self.delayed else 0.0,
+            "maxWait": self.maxWait,
+        }
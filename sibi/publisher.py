@@ -0,0 +1,189 @@
+import time
+from collections import deque
+from typing import List, Tuple
+
+import redis
+from loguru import logger
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
+
+from sibi.latency import LatencyHistogram
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+MODE_PUBSUB = "pubsub"
+MODE_STREAMS = "streams"
+MODE_BOTH = "both"
+MODES = (MODE_PUBSUB, MODE_STREAMS, MODE_BOTH)
+
+# Channels written to a stream (same name) in the streams modes, the others are always published
+STREAM_CHANNELS = ("tickPrice", "orderStatus", "openOrder")
+
+
+class RedisPublisher:
+    """Publishes on Redis without ever blocking the reactor.
+
+    Messages published during one reactor iteration are queued and written together, with one
+    non-transactional pipeline run in the reactor thread pool. While a write is in flight new
+    messages keep queuing and go out with the next one. When Redis is unreachable the batch is
+    put back and retried with exponential backoff; the connection pool reconnects by itself.
+
+    The backlog is bounded: once maxBacklog messages are waiting, the oldest (or the newest, see
+    dropPolicy) are dropped and counted.
+
+    In the streams mode the stream channels are appended to Redis streams of the same name
+    (XADD MAXLEN ~ streamMaxLen, the message in the "data" field) instead of being published, so
+    consumers can read them in batches with XREAD or consumer groups and catch up after a stall.
+    The both mode publishes and appends them.
+
+    latency records, for every batch, how long its oldest message waited before Redis had it.
+
+    Args:
+        host (str): Redis host
+        port (int): Redis port
+        db (int): Redis database
+        maxBacklog (int): How many messages can wait for Redis
+        dropPolicy (str): Which messages are dropped when the backlog is full, "oldest" or "newest"
+        maxConnections (int): Size of the connection pool
+        clock: The reactor (or a twisted.internet.task.Clock)
+        mode (str): "pubsub", "streams" or "both"
+        streamMaxLen (int): Approximate length streams are trimmed to
+        streamChannels (tuple): Channels written to streams in the streams modes
+    """
+
+    minRetryDelay = 0.1
+    maxRetryDelay = 5.0
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        maxBacklog: int = 100_000,
+        dropPolicy: str = DROP_OLDEST,
+        maxConnections: int = 4,
+        clock=reactor,
+        mode: str = MODE_PUBSUB,
+        streamMaxLen: int = 100_000,
+        streamChannels: tuple = STREAM_CHANNELS,
+    ) -> None:
+        if dropPolicy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy {dropPolicy!r}")
+        if mode not in MODES:
+            raise ValueError(f"Unknown publishing mode {mode!r}")
+        self.pool = redis.ConnectionPool(
+            host=host, port=port, db=db, max_connections=maxConnections
+        )
+        self.redis = redis.StrictRedis(connection_pool=self.pool)
+        self.maxBacklog = maxBacklog
+        self.dropPolicy = dropPolicy
+        self.clock = clock
+        self.mode = mode
+        self.streamMaxLen = streamMaxLen
+        self.streams = frozenset() if mode == MODE_PUBSUB else frozenset(streamChannels)
+        self.runInThread = deferToThread
+        self.backlog = deque()
+        self.backlogSince = None  # When the oldest message of the backlog was queued
+        self.latency = LatencyHistogram()
+        self.flushCall = None
+        self.inFlight = False
+        self.retryDelay = self.minRetryDelay
+        self.published = 0
+        self.streamed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+
+    def publish(self, channel: str, message: str) -> None:
+        """ Queues message for channel, it's written at the end of the current reactor iteration """
+
+        if len(self.backlog) >= self.maxBacklog:
+            self.dropped += 1
+            if self.dropPolicy == DROP_NEWEST:
+                return
+            self.backlog.popleft()
+        elif not self.backlog:
+            self.backlogSince = time.monotonic_ns()
+        self.backlog.append((channel, message))
+        if self.flushCall is None and not self.inFlight:
+            self.flushCall = self.clock.callLater(0, self.flush)
+
+    def flush(self) -> None:
+        self.flushCall = None
+        if self.inFlight or not self.backlog:
+            return
+        batch, self.backlog = list(self.backlog), deque()
+        since, self.backlogSince = self.backlogSince, None
+        self.inFlight = True
+        self.runInThread(self._write, batch).addCallbacks(
+            self._written,
+            self._failed,
+            callbackArgs=(batch, since),
+            errbackArgs=(batch, since),
+        )
+
+    def _write(self, batch: List[Tuple[str, str]]) -> int:
+        """ Runs in a thread, returns how many messages were appended to streams """
+
+        pipeline = self.redis.pipeline(transaction=False)
+        streams = self.streams
+        publishStreams = self.mode == MODE_BOTH
+        maxLen = self.streamMaxLen
+        streamed = 0
+        for channel, message in batch:
+            if channel in streams:
+                pipeline.xadd(channel, {"data": message}, maxlen=maxLen, approximate=True)
+                streamed += 1
+                if not publishStreams:
+                    continue
+            pipeline.publish(channel, message)
+        pipeline.execute()
+        return streamed
+
+    def _written(self, streamed: int, batch: List[Tuple[str, str]], since: int) -> None:
+        self.inFlight = False
+        self.latency.since(since)
+        # Stream messages are published too in the both mode only
+        self.published += len(batch) if self.mode == MODE_BOTH else len(batch) - streamed
+        self.streamed += streamed
+        self.batches += 1
+        self.retryDelay = self.minRetryDelay
+        if self.backlog and self.flushCall is None:
+            self.flushCall = self.clock.callLater(0, self.flush)
+
+    def _failed(self, failure, batch: List[Tuple[str, str]], since: int) -> None:
+        self.inFlight = False
+        self.backlogSince = since
+        self.failures += 1
+        logger.warning(
+            f"Redis publish failed ({failure.getErrorMessage()}), retrying in {self.retryDelay:.1f}s"
+        )
+
+        # Put the batch back in front, still within maxBacklog
+        self.backlog.extendleft(reversed(batch))
+        excess = len(self.backlog) - self.maxBacklog
+        if excess > 0:
+            self.dropped += excess
+            for _ in range(excess):
+                if self.dropPolicy == DROP_OLDEST:
+                    self.backlog.popleft()
+                else:
+                    self.backlog.pop()
+
+        if self.flushCall is not None and self.flushCall.active():
+            self.flushCall.cancel()
+        self.flushCall = self.clock.callLater(self.retryDelay, self.flush)
+        self.retryDelay = min(self.retryDelay * 2, self.maxRetryDelay)
+
+    def stats(self) -> dict:
+        return {
+            "backlog": len(self.backlog),
+            "maxBacklog": self.maxBacklog,
+            "mode": self.mode,
+            "published": self.published,
+            "streamed": self.streamed,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
@@ -0,0 +1,123 @@
+import time
+from typing import Dict, Iterable, Optional
+
+from sibi.ibapi.ticktype import TickTypeEnum
+
+# Tick types (live and delayed) stored in a Quote slot
+QUOTE_SLOTS = {
+    TickTypeEnum.BID: "bid",
+    TickTypeEnum.ASK: "ask",
+    TickTypeEnum.LAST: "last",
+    TickTypeEnum.BID_SIZE: "bidSize",
+    TickTypeEnum.ASK_SIZE: "askSize",
+    TickTypeEnum.LAST_SIZE: "lastSize",
+    TickTypeEnum.HIGH: "high",
+    TickTypeEnum.LOW: "low",
+    TickTypeEnum.CLOSE: "close",
+    TickTypeEnum.OPEN: "open",
+    TickTypeEnum.VOLUME: "volume",
+    TickTypeEnum.LAST_TIMESTAMP: "lastTimestamp",
+    TickTypeEnum.DELAYED_BID: "bid",
+    TickTypeEnum.DELAYED_ASK: "ask",
+    TickTypeEnum.DELAYED_LAST: "last",
+    TickTypeEnum.DELAYED_BID_SIZE: "bidSize",
+    TickTypeEnum.DELAYED_ASK_SIZE: "askSize",
+    TickTypeEnum.DELAYED_LAST_SIZE: "lastSize",
+    TickTypeEnum.DELAYED_HIGH: "high",
+    TickTypeEnum.DELAYED_LOW: "low",
+    TickTypeEnum.DELAYED_CLOSE: "close",
+    TickTypeEnum.DELAYED_OPEN: "open",
+    TickTypeEnum.DELAYED_VOLUME: "volume",
+    TickTypeEnum.DELAYED_LAST_TIMESTAMP: "lastTimestamp",
+}
+
+# Slots whose receive time is kept in their own <slot>Time slot
+TIMED_SLOTS = {"bid": "bidTime", "ask": "askTime", "last": "lastTime"}
+
+
+class Quote:
+    """ Last values received for a market data line, and when they were received (epoch seconds) """
+
+    __slots__ = (
+        "bid",
+        "ask",
+        "last",
+        "bidSize",
+        "askSize",
+        "lastSize",
+        "high",
+        "low",
+        "close",
+        "open",
+        "volume",
+        "lastTimestamp",
+        "bidTime",
+        "askTime",
+        "lastTime",
+        "updated",
+        "extra",
+    )
+
+    def __init__(self) -> None:
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+
+    def to_dict(self) -> dict:
+        data = {slot: getattr(self, slot) for slot in self.__slots__[:-1]}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class QuoteTable:
+    """ Quote of every market data line, by reqId, updated by the tick pipeline """
+
+    tickTypes = None
+
+    def __init__(self, clock=time.time) -> None:
+        self.clock = clock
+        self.quotes: Dict[int, Quote] = {}
+
+    def update(self, reqId: int, tickType: int, value, updatedAt: float = None) -> None:
+        """ Stores a tick value (price, size, string or generic) received at updatedAt, defaults to now """
+
+        quote = self.quotes.get(reqId)
+        if quote is None:
+            quote = self.quotes[reqId] = Quote()
+        now = self.clock() if updatedAt is None else updatedAt
+        quote.updated = now
+
+        slot = QUOTE_SLOTS.get(tickType)
+        if slot is None:
+            if quote.extra is None:
+                quote.extra = {}
+            quote.extra[TickTypeEnum.to_str(tickType)] = value
+            return
+        setattr(quote, slot, value)
+        timed = TIMED_SLOTS.get(slot)
+        if timed is not None:
+            setattr(quote, timed, now)
+
+    def emit(self, event) -> None:
+        """ Tick pipeline sink """
+
+        self.update(event.reqId, event.tickType, event.value, event.ts / 1e9)
+
+    def get(self, reqId: int) -> Optional[Quote]:
+        return self.quotes.get(reqId)
+
+    def remove(self, reqId: int) -> None:
+        self.quotes.pop(reqId, None)
+
+    def clear(self) -> None:
+        self.quotes.clear()
+
+    def snapshot(self, reqIds: Iterable[int] = None) -> Dict[int, Optional[dict]]:
+        """ Quotes of reqIds (every quote if None) as dicts, None for unknown reqIds """
+
+        if reqIds is None:
+            reqIds = list(self.quotes)
+        quotes = self.quotes
+        return {
+            reqId: quotes[reqId].to_dict() if reqId in quotes else None for reqId in reqIds
+        }
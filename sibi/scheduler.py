@@ -0,0 +1,179 @@
+from collections import deque
+from typing import Callable, List
+
+from loguru import logger
+from twisted.internet import reactor
+
+from sibi.ibapi.message import OUT
+
+# Priority classes, lower goes first
+(CANCEL, ORDER, DEFAULT, MARKET_DATA, HISTORICAL) = range(5)
+PRIORITY_NAMES = ("cancel", "order", "default", "marketData", "historical")
+
+MSG_PRIORITIES = {
+    OUT.CANCEL_ORDER: CANCEL,
+    OUT.REQ_GLOBAL_CANCEL: CANCEL,
+    OUT.CANCEL_MKT_DATA: CANCEL,
+    OUT.CANCEL_MKT_DEPTH: CANCEL,
+    OUT.CANCEL_HISTORICAL_DATA: CANCEL,
+    OUT.CANCEL_REAL_TIME_BARS: CANCEL,
+    OUT.CANCEL_TICK_BY_TICK_DATA: CANCEL,
+    OUT.CANCEL_HEAD_TIMESTAMP: CANCEL,
+    OUT.CANCEL_HISTOGRAM_DATA: CANCEL,
+    OUT.PLACE_ORDER: ORDER,
+    OUT.REQ_MKT_DATA: MARKET_DATA,
+    OUT.REQ_MKT_DEPTH: MARKET_DATA,
+    OUT.REQ_REAL_TIME_BARS: MARKET_DATA,
+    OUT.REQ_TICK_BY_TICK_DATA: MARKET_DATA,
+    OUT.REQ_HISTORICAL_DATA: HISTORICAL,
+    OUT.REQ_HISTORICAL_TICKS: HISTORICAL,
+    OUT.REQ_HEAD_TIMESTAMP: HISTORICAL,
+    OUT.REQ_HISTOGRAM_DATA: HISTORICAL,
+}
+
+# Slack on token comparisons, so float rounding can't leave a drain spinning a hair short of a token
+EPSILON = 1e-9
+
+
+def priorityOf(frame: bytes) -> int:
+    """ Priority class of a length prefixed frame, read from its message id """
+
+    end = frame.find(b"\0", 4)
+    try:
+        return MSG_PRIORITIES.get(int(frame[4:end]), DEFAULT)
+    except ValueError:
+        return DEFAULT
+
+
+class OutboundScheduler:
+    """Token bucket pacing the frames sent to TWS, which drops clients going over ~50 messages/sec.
+
+    Frames are sent right away while tokens are available. Otherwise they wait in one FIFO queue
+    per priority class, and the queues are drained highest priority first as tokens refill:
+    cancels, then orders (placements and modifications), then everything else, and new market
+    data and historical requests last.
+
+    With rate r and burst b no more than b + r frames leave in any one second.
+
+    Args:
+        send (Callable): Writes a frame to TWS
+        rate (float): Sustained frames per second
+        burst (int): Bucket capacity, ie. how many frames can leave back to back
+        clock: The reactor (or a twisted.internet.task.Clock)
+        onSent (Callable): Called with the reqId of every tagged frame once it's sent
+    """
+
+    def __init__(
+        self,
+        send: Callable[[bytes], None],
+        rate: float = 40,
+        burst: int = 10,
+        clock=reactor,
+        onSent: Callable[[int], None] = None,
+    ) -> None:
+        self.send = send
+        self.onSent = onSent
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.lastRefill = clock.seconds()
+        self.queues = [deque() for _ in PRIORITY_NAMES]
+        self.drainCall = None
+        self.resetStats()
+
+    def resetStats(self) -> None:
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.delayed = [0] * len(PRIORITY_NAMES)
+        self.drained = [0] * len(PRIORITY_NAMES)  # Delayed frames sent, clear() drops the others
+        self.maxDepth = [0] * len(PRIORITY_NAMES)
+        self.totalWait = [0.0] * len(PRIORITY_NAMES)
+        self.maxWait = [0.0] * len(PRIORITY_NAMES)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.lastRefill) * self.rate)
+        self.lastRefill = now
+
+    def submit(self, frame: bytes, priority: int = None, reqId: int = None) -> None:
+        """Sends frame now if the bucket allows it, queues it otherwise.
+        reqId, if any, is the request waiting for an answer to frame
+        """
+
+        if priority is None:
+            priority = priorityOf(frame)
+        now = self.clock.seconds()
+        self._refill(now)
+
+        if self.tokens + EPSILON >= 1 and not any(self.queues):
+            self.tokens -= 1
+            self.sent[priority] += 1
+            self.send(frame)
+            if reqId is not None and self.onSent is not None:
+                self.onSent(reqId)
+            return
+
+        queue = self.queues[priority]
+        queue.append((now, frame, reqId))
+        self.delayed[priority] += 1
+        if len(queue) > self.maxDepth[priority]:
+            self.maxDepth[priority] = len(queue)
+        self._scheduleDrain()
+
+    def _scheduleDrain(self) -> None:
+        if self.drainCall is not None and self.drainCall.active():
+            return
+        delay = max(EPSILON, (1 - self.tokens) / self.rate)
+        self.drainCall = self.clock.callLater(delay, self.drain)
+
+    def drain(self) -> None:
+        """ Sends as many queued frames as the bucket allows, highest priority first """
+
+        now = self.clock.seconds()
+        self._refill(now)
+        for priority, queue in enumerate(self.queues):
+            while queue and self.tokens + EPSILON >= 1:
+                queuedAt, frame, reqId = queue.popleft()
+                self.tokens -= 1
+                wait = now - queuedAt
+                self.sent[priority] += 1
+                self.drained[priority] += 1
+                self.totalWait[priority] += wait
+                if wait > self.maxWait[priority]:
+                    self.maxWait[priority] = wait
+                self.send(frame)
+                if reqId is not None and self.onSent is not None:
+                    self.onSent(reqId)
+
+        if any(self.queues):
+            self._scheduleDrain()
+
+    def clear(self) -> List[int]:
+        """ Drops every queued frame (eg. when the TWS connection is lost), returns their reqIds """
+
+        dropped = sum(len(queue) for queue in self.queues)
+        reqIds = [reqId for queue in self.queues for _, _, reqId in queue if reqId is not None]
+        for queue in self.queues:
+            queue.clear()
+        if self.drainCall is not None and self.drainCall.active():
+            self.drainCall.cancel()
+        self.drainCall = None
+        if dropped:
+            logger.warning(f"Dropped {dropped} queued requests")
+        return reqIds
+
+    def stats(self) -> dict:
+        """ Queue depth and wait time (seconds) per priority class """
+
+        return {
+            name: {
+                "depth": len(self.queues[priority]),
+                "maxDepth": self.maxDepth[priority],
+                "sent": self.sent[priority],
+                "delayed": self.delayed[priority],
+                "avgWait": self.totalWait[priority] / self.drained[priority]
+                if self.drained[priority]
+                else 0.0,
+                "maxWait": self.maxWait[priority],
+            }
+            for priority, name in enumerate(PRIORITY_NAMES)
+        }
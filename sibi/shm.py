@@ -0,0 +1,143 @@
+"""Ring buffer of ticks in shared memory, for consumers running on the same host as sibi.
+
+sibi is the only writer. Readers attach by name and poll without locks: every record carries the
+sequence number it was written with, so a reader can tell a fresh record from one overwritten
+(it fell more than capacity ticks behind) or being written.
+
+Usage (consumer side)::
+
+    from sibi.shm import ShmTickReader
+    reader = ShmTickReader("sibi-ticks")
+    while True:
+        for tick in reader.poll():
+            print(tick.reqId, tick.tickType, tick.value, tick.ts)
+"""
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import List
+
+from loguru import logger
+
+from sibi.wire import Tick
+
+MAGIC = 0x53494249  # "SIBI"
+VERSION = 1
+
+# magic, version, record size, capacity | sequence of the last record written
+HEADER = struct.Struct("<IHHI4xQ")
+HEADER_SIZE = 64
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 16
+
+# sequence, reqId, tickType, value, ts
+RECORD = struct.Struct("<Qih2xdq")
+
+# Blocks created by writers of this process
+_owned = set()
+
+
+class ShmTickWriter:
+    """Writes ticks into a new shared memory ring buffer.
+
+    Args:
+        name (str): Name of the shared memory block readers attach to
+        capacity (int): How many ticks the ring holds
+    """
+
+    def __init__(self, name: str, capacity: int = 65536) -> None:
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * RECORD.size
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that didn't close it (eg. it crashed): readers still attached
+            # keep the old block, new ones attach to the new one
+            logger.warning(f"Replacing stale shared memory block {name}")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buffer = self.memory.buf
+        self.sequence = 0
+        _owned.add(self.memory._name)
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, RECORD.size, capacity, 0)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def write(self, reqId: int, tickType: int, value: float, ts: int) -> None:
+        sequence = self.sequence + 1
+        offset = HEADER_SIZE + (self.sequence % self.capacity) * RECORD.size
+        buffer = self.buffer
+        # Invalidate the slot first, so a reader never takes a half written record for a whole one
+        SEQUENCE.pack_into(buffer, offset, 0)
+        RECORD.pack_into(buffer, offset, 0, reqId, tickType, value, ts)
+        SEQUENCE.pack_into(buffer, offset, sequence)
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, sequence)
+        self.sequence = sequence
+
+    def close(self) -> None:
+        """ Releases and removes the shared memory block """
+
+        self.buffer = None
+        _owned.discard(self.memory._name)
+        self.memory.close()
+        self.memory.unlink()
+
+
+class ShmTickReader:
+    """Reads the ticks written by a ShmTickWriter.
+
+    Args:
+        name (str): Name of the shared memory block
+        fromStart (bool): Start from the oldest tick still in the ring instead of the next one
+    """
+
+    def __init__(self, name: str, fromStart: bool = False) -> None:
+        self.memory = shared_memory.SharedMemory(name=name)
+        # Attaching registers the block with this process' resource tracker, which would remove it
+        # when the reader exits: only the writer owns it
+        if self.memory._name not in _owned:
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.buffer = self.memory.buf
+        magic, version, recordSize, self.capacity, _ = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+            raise ValueError(f"{name} is not a sibi tick ring")
+        written = self.written()
+        self.position = max(0, written - self.capacity) if fromStart else written
+        self.lost = 0
+
+    def written(self) -> int:
+        """ How many ticks were written so far """
+
+        return SEQUENCE.unpack_from(self.buffer, SEQUENCE_OFFSET)[0]
+
+    def poll(self) -> List[Tick]:
+        """ Ticks written since the previous poll. Ticks overwritten in the meantime are counted in lost """
+
+        written = self.written()
+        position = self.position
+        if written - position > self.capacity:
+            self.lost += written - position - self.capacity
+            position = written - self.capacity
+
+        ticks = []
+        buffer = self.buffer
+        capacity = self.capacity
+        unpack = RECORD.unpack_from
+        while position < written:
+            offset = HEADER_SIZE + (position % capacity) * RECORD.size
+            sequence, reqId, tickType, value, ts = unpack(buffer, offset)
+            if sequence != position + 1 or SEQUENCE.unpack_from(buffer, offset)[0] != sequence:
+                # Overwritten by the writer while reading
+                self.lost += 1
+            else:
+                ticks.append(Tick(reqId, tickType, value, ts))
+            position += 1
+        self.position = position
+        return ticks
+
+    def close(self) -> None:
+        self.buffer = None
+        self.memory.close()
@@ -0,0 +1,96 @@
+from typing import Dict, Hashable, List, Optional
+
+from sibi.ibapi.contract import Contract
+from sibi.pacing import CONTRACT_KEY_FIELDS
+
+
+def subscriptionKey(contract: Contract, genericTickList: str = "") -> Hashable:
+    """ Contracts with the same key and generic ticks can share one market data line """
+
+    if contract.conId:
+        contractKey = (int(contract.conId), contract.exchange or "")
+    else:
+        contractKey = tuple(getattr(contract, field, None) for field in CONTRACT_KEY_FIELDS)
+    ticks = ",".join(sorted(tick.strip() for tick in genericTickList.split(",") if tick.strip()))
+    return contractKey, ticks
+
+
+class Subscription:
+    __slots__ = ("reqId", "key", "subscribers")
+
+    def __init__(self, reqId: int, key: Hashable) -> None:
+        self.reqId = reqId
+        self.key = key
+        self.subscribers = 1
+
+
+class SubscriptionRegistry:
+    """Streaming market data lines open with TWS, with how many subscribers share each of them.
+
+    Lines are found by reqId or by subscriptionKey in O(1).
+    """
+
+    def __init__(self) -> None:
+        self.byReqId: Dict[int, Subscription] = {}
+        self.byKey: Dict[Hashable, Subscription] = {}
+
+    def __len__(self) -> int:
+        return len(self.byReqId)
+
+    def __contains__(self, reqId: int) -> bool:
+        return reqId in self.byReqId
+
+    def find(self, key: Hashable) -> Optional[Subscription]:
+        return self.byKey.get(key)
+
+    def add(self, reqId: int, key: Hashable) -> Subscription:
+        """ Registers a new line opened with reqId, with one subscriber """
+
+        subscription = self.byKey[key] = self.byReqId[reqId] = Subscription(reqId, key)
+        return subscription
+
+    def acquire(self, key: Hashable) -> Optional[Subscription]:
+        """ Adds a subscriber to the line for key, if there's one """
+
+        subscription = self.byKey.get(key)
+        if subscription is not None:
+            subscription.subscribers += 1
+        return subscription
+
+    def release(self, reqId: int) -> bool:
+        """Removes a subscriber from the line reqId.
+
+        Returns:
+            bool: True if the line has no subscriber left (or is unknown) and has to be cancelled
+        """
+
+        subscription = self.byReqId.get(reqId)
+        if subscription is None:
+            return True
+        subscription.subscribers -= 1
+        if subscription.subscribers > 0:
+            return False
+        self.remove(reqId)
+        return True
+
+    def remove(self, reqId: int) -> Optional[Subscription]:
+        """ Forgets the line reqId, whatever its subscribers """
+
+        subscription = self.byReqId.pop(reqId, None)
+        if subscription is not None:
+            del self.byKey[subscription.key]
+        return subscription
+
+    def clear(self) -> List[int]:
+        """ Forgets every line, returning their reqIds """
+
+        reqIds = list(self.byReqId)
+        self.byReqId.clear()
+        self.byKey.clear()
+        return reqIds
+
+    def stats(self) -> dict:
+        return {
+            "lines": len(self.byReqId),
+            "subscribers": sum(subscription.subscribers for subscription in self.byReqId.values()),
+        }
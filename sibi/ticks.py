@@ -0,0 +1,185 @@
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from sibi.decorators import serialize
+from sibi.ibapi.ticktype import TickTypeEnum
+from sibi.latency import LatencyHistogram
+
+# Kinds of tick, by the wrapper callback they come from
+PRICE, SIZE, STRING, GENERIC, OPTION = range(5)
+
+# Channel and JSON field (None: the fields of the value) of every kind
+KINDS = {
+    PRICE: ("tickPrice", "price"),
+    SIZE: ("tickSize", "size"),
+    STRING: ("tickString", "value"),
+    GENERIC: ("tickGeneric", "value"),
+    OPTION: ("tickOptionComputation", None),
+}
+
+OPTION_FIELDS = (
+    "impliedVol",
+    "delta",
+    "optPrice",
+    "pvDividend",
+    "gamma",
+    "vega",
+    "theta",
+    "undPrice",
+)
+
+
+class TickEvent(NamedTuple):
+    reqId: int
+    tickType: int
+    kind: int
+    value: object  # float, int, str or, for OPTION, a dict of OPTION_FIELDS
+    ts: int  # When the pipeline emitted the event, epoch nanoseconds
+    receivedAt: Optional[int] = None  # Receive time of the frame, time.monotonic_ns
+
+
+def parseTickTypes(spec: str) -> Optional[frozenset]:
+    """ Parses "BID,ASK,LAST" (names or ids) into tick type ids, None (every tick type) if empty """
+
+    tickTypes = set()
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tickType = int(item) if item.isdigit() else getattr(TickTypeEnum, item.upper(), None)
+        if tickType is None:
+            raise ValueError(f"Unknown tick type {item!r}")
+        tickTypes.add(tickType)
+    return frozenset(tickTypes) or None
+
+
+class TickSink:
+    """Holds the tick type filter of the sinks below, which add their emit(event) method.
+
+    Args:
+        tickTypes (Iterable[int]): Tick types the sink receives, every one if None
+    """
+
+    def __init__(self, tickTypes: Iterable[int] = None) -> None:
+        self.tickTypes = None if tickTypes is None else frozenset(tickTypes)
+
+
+class CallbackSink(TickSink):
+    """ Calls callback(event) in the reactor thread, it must not block """
+
+    def __init__(self, callback: Callable[[TickEvent], None], tickTypes: Iterable[int] = None) -> None:
+        super().__init__(tickTypes)
+        self.emit = callback
+
+
+class RedisSink(TickSink):
+    """Publishes every tick on the channel of its kind (tickPrice, tickSize...), as JSON merged with
+    the contract of its reqId or, for the channels listed in wireFormats, in a sibi.wire format.
+
+    Args:
+        publish (Callable): Publishes a message (channel, message)
+        additionalInfo (dict): Extra fields merged into the events of a reqId
+        payloads (dict): payloadTemplate of additionalInfo, by reqId
+        wireFormats (dict): sibi.wire formats replacing JSON, by channel
+        tickTypes (Iterable[int]): Tick types published, every one if None
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, object], None],
+        additionalInfo: dict,
+        payloads: dict,
+        wireFormats: dict = None,
+        tickTypes: Iterable[int] = None,
+    ) -> None:
+        super().__init__(tickTypes)
+        self.publish = publish
+        self.additionalInfo = additionalInfo
+        self.payloads = payloads
+        self.wireFormats = {} if wireFormats is None else wireFormats
+
+    def emit(self, event: TickEvent) -> None:
+        reqId, tickType, kind, value, ts, receivedAt = event
+        channel, field = KINDS[kind]
+        wireFormat = self.wireFormats.get(channel)
+        if wireFormat is not None and isinstance(value, (int, float)):
+            self.publish(
+                channel, wireFormat.encodeTick(reqId, tickType, value, ts, receivedAt or 0)
+            )
+            return
+
+        data = {"reqId": reqId, "tickType": TickTypeEnum.to_str(tickType)}
+        if field is None:
+            data.update(value)
+        else:
+            data[field] = value
+        if receivedAt is not None:
+            data["receivedAt"] = receivedAt
+        self.publish(
+            channel, serialize(data, self.additionalInfo.get(reqId), self.payloads.get(reqId))
+        )
+
+
+class ShmSink(TickSink):
+    """ Writes numeric ticks to a sibi.shm.ShmTickWriter """
+
+    def __init__(self, writer, tickTypes: Iterable[int] = None) -> None:
+        super().__init__(tickTypes)
+        self.writer = writer
+
+    def emit(self, event: TickEvent) -> None:
+        if isinstance(event.value, (int, float)):
+            self.writer.write(event.reqId, event.tickType, event.value, event.ts)
+
+
+class TickPipeline:
+    """Normalizes the tick* callbacks into TickEvents, timestamped once, and hands them to the sinks
+    accepting their tick type. Which sinks accept a tick type is worked out once, so ticks nobody
+    wants cost a dict lookup.
+
+    A sink is anything with a tickTypes attribute (None for every tick type) and an emit(event)
+    method, eg. a TickSink.
+
+    Args:
+        clock: Returns the time events are stamped with, epoch nanoseconds
+        latency (LatencyHistogram): Records the time from the frame receive to the event
+    """
+
+    def __init__(
+        self, clock: Callable[[], int] = time.time_ns, latency: LatencyHistogram = None
+    ) -> None:
+        self.clock = clock
+        self.latency = latency
+        self.sinks: List = []
+        self.routes = {}  # tickType -> sinks
+        self.emitted = 0
+
+    def add(self, sink):
+        self.sinks.append(sink)
+        self.routes.clear()
+        return sink
+
+    def remove(self, sink) -> None:
+        self.sinks.remove(sink)
+        self.routes.clear()
+
+    def emit(
+        self, reqId: int, tickType: int, kind: int, value, receivedAt: int = None
+    ) -> Optional[TickEvent]:
+        sinks = self.routes.get(tickType)
+        if sinks is None:
+            sinks = self.routes[tickType] = tuple(
+                sink for sink in self.sinks if sink.tickTypes is None or tickType in sink.tickTypes
+            )
+        if not sinks:
+            return None
+        if receivedAt is not None and self.latency is not None:
+            self.latency.since(receivedAt)
+        event = TickEvent(reqId, tickType, kind, value, self.clock(), receivedAt)
+        for sink in sinks:
+            sink.emit(event)
+        self.emitted += 1
+        return event
+
+    def stats(self) -> dict:
+        return {
+            "emitted": self.emitted,
+            "sinks": [type(sink).__name__ for sink in self.sinks],
+        }
@@ -0,0 +1,121 @@
+"""Compact wire formats for published market data, and the helpers consumers decode them with.
+
+A tick is (reqId, tickType, value, ts, receivedAt): tickType is the TickTypeEnum id, ts the
+publish time in epoch nanoseconds and receivedAt the time.monotonic_ns() its frame was received at
+(0 if unknown; the newest one of the snapshot for tickSnapshot). Contract fields are not repeated
+in every tick, consumers map reqId to the contract returned by reqMktData.
+
+* struct: every tick is a fixed 30 bytes little endian record (int32, int16, float64, int64,
+  int64), a message holding more ticks (eg. tickSnapshot) is their concatenation
+* msgpack: an array of [reqId, tickType, value, ts, receivedAt] arrays (needs the msgpack package)
+
+Usage (consumer side)::
+
+    from sibi.wire import decodeTicks
+    for tick in decodeTicks(message, "struct"):
+        print(tick.reqId, tick.tickType, tick.value, tick.ts)
+"""
+import struct
+from typing import Iterable, List, NamedTuple, Tuple
+
+try:
+    import msgpack
+except ImportError:  # Optional, only needed by the msgpack format
+    msgpack = None
+
+RECORD = struct.Struct("<ihdqq")
+
+# Channels carrying numeric ticks, the ones a compact format applies to
+TICK_CHANNELS = ("tickPrice", "tickSize", "tickGeneric", "tickSnapshot")
+
+
+class Tick(NamedTuple):
+    reqId: int
+    tickType: int
+    value: float
+    ts: int
+    receivedAt: int = 0
+
+
+def numeric(ticks: Iterable[Tuple[int, object]]) -> Iterable[Tuple[int, float]]:
+    """ Leaves out string ticks (eg. LAST_TIMESTAMP, RT_VOLUME), the compact formats carry numbers only """
+
+    return ((tickType, value) for tickType, value in ticks if isinstance(value, (int, float)))
+
+
+class StructFormat:
+    name = "struct"
+
+    @staticmethod
+    def encodeTick(reqId: int, tickType: int, value: float, ts: int, receivedAt: int = 0) -> bytes:
+        return RECORD.pack(reqId, tickType, value, ts, receivedAt)
+
+    @staticmethod
+    def encodeTicks(
+        reqId: int, ticks: Iterable[Tuple[int, float]], ts: int, receivedAt: int = 0
+    ) -> bytes:
+        pack = RECORD.pack
+        return b"".join(
+            pack(reqId, tickType, value, ts, receivedAt) for tickType, value in numeric(ticks)
+        )
+
+    @staticmethod
+    def decode(payload: bytes) -> List[Tick]:
+        return [Tick(*fields) for fields in RECORD.iter_unpack(payload)]
+
+
+class MsgpackFormat:
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("The msgpack wire format needs the msgpack package")
+
+    @staticmethod
+    def encodeTick(reqId: int, tickType: int, value: float, ts: int, receivedAt: int = 0) -> bytes:
+        return msgpack.packb(((reqId, tickType, value, ts, receivedAt),))
+
+    @staticmethod
+    def encodeTicks(
+        reqId: int, ticks: Iterable[Tuple[int, float]], ts: int, receivedAt: int = 0
+    ) -> bytes:
+        return msgpack.packb(
+            [(reqId, tickType, value, ts, receivedAt) for tickType, value in numeric(ticks)]
+        )
+
+    @staticmethod
+    def decode(payload: bytes) -> List[Tick]:
+        return [Tick(*fields) for fields in msgpack.unpackb(payload)]
+
+
+FORMATS = {"struct": StructFormat, "msgpack": MsgpackFormat}
+
+
+def parseWireFormats(spec: str) -> dict:
+    """Parses the --wire-format option into {channel: format}.
+
+    "json" (or "") keeps JSON everywhere, "struct" or "msgpack" applies to every tick channel,
+    and "tickPrice=struct,tickSnapshot=msgpack" chooses channel by channel.
+    """
+
+    formats = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        channel, _, name = item.rpartition("=")
+        channels = [channel] if channel else TICK_CHANNELS
+        if channel and channel not in TICK_CHANNELS:
+            raise ValueError(f"{channel} can't use a compact wire format")
+        if name == "json":
+            for channel in channels:
+                formats.pop(channel, None)
+            continue
+        if name not in FORMATS:
+            raise ValueError(f"Unknown wire format {name!r}")
+        for channel in channels:
+            formats[channel] = FORMATS[name]()
+    return formats
+
+
+def decodeTicks(payload: bytes, format: str = "struct") -> List[Tick]:
+    """ Decodes a message published in a compact wire format """
+
+    return FORMATS[format].decode(payload)
@@ -1,3 +1,4 @@
+import json
 import sys
 from typing import List
 
@@ -57,6 +58,43 @@ class XMLRPCServer(xmlrpc.XMLRPC):
 
         return result
 
+    def xmlrpc_reqContractDetailsBatch(self, specs: list, concurrency: int = 50):
+        """Resolves many contracts in one call. Returns (as JSON) one item per spec, in the same order:
+        {"result": [contract, ...]} or {"error": {...}}
+
+        Args:
+            specs (list): Contract fields (eg. {"symbol": "SPY", "secType": "OPT", "strike": 400, ...}),
+                defaults are the same as reqContractDetails
+            concurrency (int): How many requests can be in flight with TWS at the same time
+        """
+
+        contracts = []
+        errors = {}
+        for index, spec in enumerate(specs):
+            contract = Contract()
+            contract.secType = "STK"
+            contract.currency = "USD"
+            contract.exchange = "SMART"
+            contract.includeExpired = False
+            for key, value in spec.items():
+                if not hasattr(contract, key):
+                    errors[index] = {"error": {"code": -1, "message": f"Unknown field {key}"}}
+                    break
+                setattr(contract, key, value)
+            else:
+                contracts.append(contract)
+
+        if not errors:
+            return self.factory.reqContractDetailsBatch(contracts, concurrency)
+
+        def merge(result):
+            items = iter(json.loads(result))
+            return json.dumps(
+                [errors[index] if index in errors else next(items) for index in range(len(specs))]
+            )
+
+        return self.factory.reqContractDetailsBatch(contracts, concurrency).addCallback(merge)
+
     def xmlrpc_reqHistoricalData(
         self,
         symbol: str = "",
@@ -71,7 +109,20 @@ class XMLRPCServer(xmlrpc.XMLRPC):
         formatDate: int = 1,
         keepUpToDate: bool = False,
         chartOptions=None,
+        columnar: bool = False,
+        chunked: bool = True,
+        cached: bool = True,
     ) -> List[BarData]:
+        """Requests historical bars for a contract.
+
+        Args:
+            columnar (bool): If True, bars are returned as columns (date, open, high, low, close, volume,
+                barCount, average) instead of one dict per bar
+            chunked (bool): If True, a durationStr longer than IB allows for barSizeSetting is split into
+                several requests, whose bars are returned as one series. Ignored with keepUpToDate
+            cached (bool): If True and sibi runs with a historical cache, bars are served from the cache
+                and only the missing ranges are requested to TWS. Ignored with keepUpToDate
+        """
         if chartOptions is None:
             chartOptions = []
         contract = Contract()
@@ -79,6 +130,30 @@ class XMLRPCServer(xmlrpc.XMLRPC):
         contract.secType = secType
         contract.currency = currency
         contract.exchange = exchange
+        if cached and self.factory.historicalCache is not None and not keepUpToDate:
+            return self.factory.reqHistoricalDataCached(
+                contract,
+                endDateTime,
+                durationStr,
+                barSizeSetting,
+                whatToShow,
+                useRTH,
+                formatDate,
+                chartOptions,
+                columnar,
+            )
+        if chunked and not keepUpToDate:
+            return self.factory.reqHistoricalDataChunked(
+                contract,
+                endDateTime,
+                durationStr,
+                barSizeSetting,
+                whatToShow,
+                useRTH,
+                formatDate,
+                chartOptions,
+                columnar,
+            )
         result = self.factory.reqHistoricalData(
             contract,
             endDateTime,
@@ -89,6 +164,7 @@ class XMLRPCServer(xmlrpc.XMLRPC):
             formatDate,
             keepUpToDate,
             chartOptions,
+            columnar,
         )
         return result
 
@@ -113,6 +189,7 @@ class XMLRPCServer(xmlrpc.XMLRPC):
         contract.strike = strike
         contract.right = right
         contract.includeExpired = False
+        self.factory.contractCache.resolve(contract)
         result = self.factory.reqMktData(contract)
         return result
 
@@ -181,6 +258,9 @@ class XMLRPCServer(xmlrpc.XMLRPC):
                     setattr(leg, key, value)
                 contract.comboLegs.append(leg)
 
+        if secType != "BAG":
+            self.factory.contractCache.resolve(contract)
+
         order = Order()
         order.action = action
         order.orderType = orderType
@@ -195,3 +275,93 @@ class XMLRPCServer(xmlrpc.XMLRPC):
     def xmlrpc_cancelOrder(self, orderId: int):
         result = self.factory.cancelOrder(orderId)
         return result
+
+    def xmlrpc_getSchedulerStats(self, reset: bool = False):
+        """Returns (as JSON) depth and wait time (seconds) of the outbound queues, per priority class
+
+        Args:
+            reset (bool): If True, counters are zeroed after being read
+        """
+
+        stats = self.factory.scheduler.stats()
+        if reset:
+            self.factory.scheduler.resetStats()
+        return json.dumps(stats)
+
+    def xmlrpc_getHistoricalPacing(self):
+        """Returns (as JSON) the state of the historical data pacing queue: queued requests and their
+        expected wait (seconds) by reqId, the wait of a new request (nextSlot) and how much of the
+        10 minutes window is used
+        """
+
+        return json.dumps(self.factory.historicalPacer.stats())
+
+    def xmlrpc_getHistoricalCacheStats(self):
+        """ Returns (as JSON) size and hit/miss counters of the historical bar cache """
+
+        if self.factory.historicalCache is None:
+            return json.dumps({})
+        cache = self.factory.historicalCache
+        return cache.defer(cache.stats).addCallback(json.dumps)
+
+    def xmlrpc_getContractCacheStats(self):
+        """ Returns (as JSON) size and hit/miss counters of the contract details cache and contract master """
+
+        stats = self.factory.contractCache.stats()
+        master = self.factory.contractMaster
+        if master is None:
+            return json.dumps(stats)
+
+        def addMaster(masterStats):
+            stats["master"] = masterStats
+            return json.dumps(stats)
+
+        return master.defer(master.stats).addCallback(addMaster)
+
+    def xmlrpc_getQuotes(self, reqIds: list = None):
+        """Returns (as JSON) the last values received for market data lines, straight from memory
+
+        Args:
+            reqIds (list): The reqIds returned by reqMktData, every line if omitted. Unknown ones map to null
+        """
+
+        return json.dumps(self.factory.quotes.snapshot(reqIds))
+
+    def xmlrpc_getPublisherStats(self):
+        """ Returns (as JSON) backlog, published, dropped and failed counters of the Redis publisher """
+
+        return json.dumps(self.factory.publisher.stats())
+
+    def xmlrpc_getLatencyStats(self, reset: bool = False):
+        """Returns (as JSON) latency histograms summaries (microseconds) of the inbound path:
+        decode (frame received -> event built), publish (frame received -> handed to the publisher)
+        and redis (queued in the publisher -> written to Redis)
+
+        Args:
+            reset (bool): If True, histograms are zeroed after being read
+        """
+
+        stats = self.factory.latency.stats()
+        stats["redis"] = self.factory.publisher.latency.stats()
+        if reset:
+            self.factory.latency.reset()
+            self.factory.publisher.latency.reset()
+        return json.dumps(stats)
+
+    def xmlrpc_getDecoderProfile(self, reset: bool = False):
+        """Returns (as JSON) messages, bytes, decoding time and wrapper callback time (microseconds)
+        by TWS message type, the most expensive first
+
+        Args:
+            reset (bool): If True, counters are zeroed after being read
+        """
+
+        profile = self.factory.decoder.profile()
+        if reset:
+            self.factory.decoder.resetProfile()
+        return json.dumps(profile)
+
+    def xmlrpc_getTickPipelineStats(self):
+        """ Returns (as JSON) how many ticks went through the tick pipeline, and its sinks """
+
+        return json.dumps(self.factory.ticks.stats())
@@ -0,0 +1,56 @@
+import pytest
+
+from sibi.bar_cache import HistoricalBarCache
+from sibi.models import HistoricalBars
+
+KEY = "series"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # Methods are called directly: defer would start the worker thread
+    cache = HistoricalBarCache(str(tmp_path / "bars.sqlite"))
+    yield cache
+    cache.db.close()
+
+
+def test_empty_cache_misses_the_whole_range(cache):
+    assert cache.gaps(KEY, 100, 200) == [(100, 200)]
+    assert cache.misses == 1
+
+
+def test_covered_range_hits(cache):
+    cache.store(KEY, HistoricalBars(), 100, 200)
+
+    assert cache.gaps(KEY, 120, 180) == []
+    assert cache.gaps(KEY, 100, 200) == []
+    assert cache.hits == 2
+
+
+def test_gaps_around_and_between_coverage(cache):
+    cache.store(KEY, HistoricalBars(), 100, 200)
+    cache.store(KEY, HistoricalBars(), 300, 400)
+
+    assert cache.gaps(KEY, 50, 450) == [(50, 100), (200, 300), (400, 450)]
+    assert cache.gaps(KEY, 150, 350) == [(200, 300)]
+    assert cache.partialHits == 2
+
+
+def test_adjacent_ranges_merge(cache):
+    cache.store(KEY, HistoricalBars(), 100, 200)
+    cache.store(KEY, HistoricalBars(), 200.5, 300)
+
+    assert cache.gaps(KEY, 100, 300) == []
+    assert cache._coverage(cache._seriesId(KEY)) == [(100, 300)]
+
+
+def test_gaps_shorter_than_a_second_are_ignored(cache):
+    cache.store(KEY, HistoricalBars(), 100, 200)
+
+    assert cache.gaps(KEY, 99.5, 200.5) == []
+
+
+def test_series_are_separate(cache):
+    cache.store(KEY, HistoricalBars(), 100, 200)
+
+    assert cache.gaps("other", 100, 200) == [(100, 200)]
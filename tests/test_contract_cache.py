@@ -0,0 +1,59 @@
+import json
+
+from sibi.contract_cache import QUERY_FIELDS, ContractCache, queryContract, queryKey
+from sibi.contract_master import ContractMaster
+from sibi.ibapi.contract import Contract
+
+
+def contract(**fields) -> Contract:
+    contract = Contract()
+    for field, value in fields.items():
+        setattr(contract, field, value)
+    return contract
+
+
+def test_queries_by_conid_have_their_own_key():
+    assert queryKey(contract(conId=265598)) != queryKey(contract(conId=8314))
+    assert queryKey(contract(conId=265598)) != queryKey(contract())
+
+
+def test_queries_by_security_id_have_their_own_key():
+    apple = contract(secIdType="isin", secId="US0378331005")
+    ibm = contract(secIdType="ISIN", secId="US4592001014")
+
+    assert queryKey(apple) != queryKey(ibm)
+    assert queryKey(apple) == queryKey(contract(secIdType="ISIN", secId="US0378331005"))
+
+
+def test_query_contract_repeats_the_query():
+    for query in (
+        contract(conId=265598),
+        contract(symbol="AAPL", secType="STK", currency="USD", exchange="SMART"),
+        contract(secIdType="ISIN", secId="US0378331005", exchange="SMART"),
+    ):
+        key = queryKey(query)
+
+        assert queryKey(queryContract(key)) == key
+        assert len(key) == len(QUERY_FIELDS)
+
+
+def test_master_forgets_queries_stored_with_another_key_layout(tmp_path):
+    path = str(tmp_path / "contracts.db")
+    master = ContractMaster(path)
+    apple = {"conId": 265598, "symbol": "AAPL", "secType": "STK"}
+    ibm = {"conId": 8314, "symbol": "IBM", "secType": "STK"}
+    master.save(queryKey(contract(conId=265598)), [apple])
+    with master.db:
+        master.db.execute(
+            "INSERT INTO queries VALUES (?, ?, ?)", (json.dumps(["IBM", "STK"] + [""] * 10), "[8314]", 0)
+        )
+        master.db.execute("INSERT INTO contracts VALUES (8314, 'IBM', 'STK', NULL, ?, 0)", (json.dumps(ibm),))
+    master.db.close()
+
+    master = ContractMaster(path)
+    cache = ContractCache()
+
+    assert master.preload(cache) == 1
+    assert [key for key, _ in master.stale(float("inf"), 10)] == [queryKey(contract(conId=265598))]
+    assert cache.getByConId(265598) == apple
+    assert master.stats()["contracts"] == 1
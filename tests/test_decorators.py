@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+from sibi.decorators import payloadTemplate, serialize
+
+INFOS = [
+    {},
+    {"symbol": "AAPL"},
+    {"symbol": "AAPL", "secType": "STK", "exchange": "SMART", "strike": 0.0, "comboLegs": None},
+]
+
+
+@pytest.mark.parametrize("info", INFOS)
+@pytest.mark.parametrize("data", [{"reqId": 1, "price": 101.25}, {"reqId": 1}])
+def test_serialize_matches_json_dumps(data, info):
+    assert serialize(data, info, payloadTemplate(info)) == json.dumps({**data, **info})
+
+
+def test_serialize_lets_info_override_data():
+    info = {"reqId": 2, "symbol": "AAPL"}
+
+    assert serialize({"reqId": 1}, info, payloadTemplate(info)) == json.dumps({"reqId": 2, "symbol": "AAPL"})
@@ -0,0 +1,156 @@
+import pytest
+
+from sibi.encoder import RequestEncoder
+from sibi.ibapi.client import EClient
+from sibi.ibapi.comm import make_msg
+from sibi.ibapi.contract import Contract
+from sibi.ibapi.order import Order
+from sibi.ibapi.tag_value import TagValue
+from sibi.ibapi.wrapper import EWrapper
+
+SERVER_VERSION = 151
+
+
+class RecordingConnection:
+    def __init__(self) -> None:
+        self.frames = []
+
+    def isConnected(self) -> bool:
+        return True
+
+    def sendMsg(self, frame: bytes) -> None:
+        self.frames.append(frame)
+
+
+class RecordingClient(EClient):
+    """ EClient connected to nothing, keeping the frames it sends """
+
+    def __init__(self) -> None:
+        super().__init__(EWrapper())
+        self.conn = RecordingConnection()
+        self.connState = EClient.CONNECTED
+        self.serverVersion_ = SERVER_VERSION
+
+    def sendMsg(self, msg: str) -> None:
+        self.conn.sendMsg(make_msg(msg))
+
+    def frame(self, name: str, *args) -> bytes:
+        getattr(EClient, name)(self, *args)
+        return self.conn.frames.pop()
+
+
+@pytest.fixture
+def client():
+    return RecordingClient()
+
+
+@pytest.fixture
+def encoder():
+    encoder = RequestEncoder()
+    encoder.specialize(SERVER_VERSION)
+    return encoder
+
+
+def makeContract(symbol="SPY", **fields):
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    for name, value in fields.items():
+        setattr(contract, name, value)
+    return contract
+
+
+CONTRACTS = [
+    makeContract(),
+    makeContract("AAPL", primaryExchange="NASDAQ", conId=265598),
+    makeContract(
+        "SPY",
+        secType="OPT",
+        lastTradeDateOrContractMonth="20241220",
+        strike=450.0,
+        right="C",
+        multiplier="100",
+        tradingClass="SPY",
+    ),
+    makeContract("ES", secType="FUT", exchange="CME", lastTradeDateOrContractMonth="202412", includeExpired=True),
+    makeContract("", secIdType="ISIN", secId="US78462F1030"),
+    # Same values as the first contract but an int strike, encoded "0" instead of "0.0"
+    makeContract(strike=0),
+]
+
+
+@pytest.mark.parametrize("contract", CONTRACTS)
+def test_req_mkt_data(client, encoder, contract):
+    for reqId, genericTickList, snapshot in ((1, "", False), (2, "233,236", False), (3, "", True)):
+        args = (reqId, contract, genericTickList, snapshot, False, [])
+        assert encoder.reqMktData(*args) == client.frame("reqMktData", *args)
+
+
+@pytest.mark.parametrize("contract", CONTRACTS)
+def test_req_historical_data(client, encoder, contract):
+    for reqId, endDateTime, keepUpToDate in ((1, "", False), (2, "20240105 16:00:00 US/Eastern", True)):
+        args = (reqId, contract, endDateTime, "2 D", "5 mins", "TRADES", 1, 2, keepUpToDate, [])
+        assert encoder.reqHistoricalData(*args) == client.frame("reqHistoricalData", *args)
+
+
+@pytest.mark.parametrize("contract", CONTRACTS)
+def test_req_contract_details(client, encoder, contract):
+    assert encoder.reqContractDetails(7, contract) == client.frame("reqContractDetails", 7, contract)
+
+
+def makeOrder(**fields):
+    order = Order()
+    order.action = "BUY"
+    order.totalQuantity = 100
+    order.orderType = "LMT"
+    order.lmtPrice = 101.25
+    for name, value in fields.items():
+        setattr(order, name, value)
+    return order
+
+
+ORDERS = [
+    makeOrder(),
+    makeOrder(orderType="MKT", lmtPrice=Order().lmtPrice, tif="DAY", account="DU123", transmit=False),
+    makeOrder(orderType="STP LMT", auxPrice=100.5, outsideRth=True, ocaGroup="oca", ocaType=1),
+    makeOrder(algoStrategy="Adaptive", algoParams=[TagValue("adaptivePriority", "Normal")]),
+    makeOrder(hedgeType="D", hedgeParam="0.5", parentId=3),
+    makeOrder(deltaNeutralOrderType="LMT", deltaNeutralAuxPrice=1.5, volatility=0.2, volatilityType=2),
+    makeOrder(scaleInitLevelSize=10, scaleSubsLevelSize=5, scalePriceIncrement=0.1, scaleAutoReset=True),
+    makeOrder(cashQty=5000.0, usePriceMgmtAlgo=True, orderRef="ref"),
+    makeOrder(usePriceMgmtAlgo=False, whatIf=True),
+]
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_place_order(client, encoder, order):
+    for contract in CONTRACTS[:3]:
+        args = (11, contract, order)
+        assert encoder.placeOrder(*args) == client.frame("placeOrder", *args)
+
+
+def test_contract_sections_are_cached(client, encoder):
+    contract = makeContract()
+    for reqId in range(1, 4):
+        args = (reqId, contract, "", False, False, [])
+        assert encoder.reqMktData(*args) == client.frame("reqMktData", *args)
+    info = encoder.mktDataContract.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+
+    # A changed contract isn't served the section cached for its old values
+    contract.exchange = "ARCA"
+    args = (4, contract, "", False, False, [])
+    assert encoder.reqMktData(*args) == client.frame("reqMktData", *args)
+    assert encoder.mktDataContract.cache_info().misses == 2
+
+
+def test_unsupported_requests_fall_back(encoder):
+    combo = makeContract(secType="BAG")
+
+    assert encoder.reqMktData(1, combo, "", False, False, []) is None
+    assert encoder.reqHistoricalData(1, combo, "", "1 D", "1 min", "TRADES", 1, 1, False, []) is None
+    assert encoder.reqMktData(1, makeContract(), "", False, False, [TagValue("a", "b")]) is None
+    assert encoder.reqContractDetails(1, makeContract("DAX€")) is None
+    assert RequestEncoder().reqContractDetails(1, makeContract()) is None
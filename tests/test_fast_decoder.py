@@ -0,0 +1,191 @@
+import pytest
+
+from sibi.fast_decoder import FastDecoder
+from sibi.framing import FieldBuffer
+from sibi.ibapi.decoder import Decoder
+from sibi.ibapi.message import IN
+from sibi.ibapi.ticktype import TickTypeEnum
+from sibi.ibapi.wrapper import EWrapper
+
+SERVER_VERSIONS = (100, 130, 151)
+
+
+def normalize(value):
+    if hasattr(value, "__dict__"):
+        return type(value).__name__, vars(value)
+    return value
+
+
+class RecordingWrapper(EWrapper):
+    """ Records every wrapper call, with the objects it gets as dicts """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = []
+
+    def __getattribute__(self, name: str):
+        attribute = object.__getattribute__(self, name)
+        if name.startswith("_") or name in ("calls", "logAnswer") or not callable(attribute):
+            return attribute
+        calls = self.calls
+
+        def record(*args):
+            calls.append((name, [normalize(arg) for arg in args]))
+            return attribute(*args)
+
+        return record
+
+
+def fieldBuffer(*fields) -> FieldBuffer:
+    return FieldBuffer(b"".join(str(field).encode() + b"\0" for field in fields))
+
+
+def decode(decoder, wrapper, fields) -> list:
+    decoder.interpret(fields)
+    return wrapper.calls
+
+
+def stockCalls(serverVersion: int, fields) -> list:
+    wrapper = RecordingWrapper()
+    return decode(Decoder(wrapper, serverVersion), wrapper, fields)
+
+
+def fastCalls(serverVersion: int, fields, wrapper=None) -> list:
+    wrapper = RecordingWrapper() if wrapper is None else wrapper
+    decoder = FastDecoder(wrapper, serverVersion)
+    decoder.specialize()
+    return decode(decoder, wrapper, fields)
+
+
+def bars(legacy: bool) -> list:
+    fields = []
+    for index, (date, volume) in enumerate((("20240104  15:58:00", 1200), ("20240104  15:59:00", ""))):
+        fields += [date, 101.25 + index, 101.5, "", 101.3, volume, 101.31]
+        if legacy:
+            fields.append("false")
+        fields.append(index * 7)
+    return fields
+
+
+def messages(serverVersion: int) -> dict:
+    hasMktCapPrice = serverVersion >= 131
+    legacyBars = serverVersion < 124
+    pnlFields = ["-12.5"] + (["3.25"] if serverVersion >= 129 else []) + (["1"] if serverVersion >= 135 else [])
+    return {
+        "tickPrice": [
+            [IN.TICK_PRICE, 6, 1, TickTypeEnum.BID, 101.25, 300, 7],
+            [IN.TICK_PRICE, 6, 1, TickTypeEnum.LAST, "", "", 1],
+            [IN.TICK_PRICE, 6, 1, TickTypeEnum.HIGH, 102.5, 0, 0],
+        ],
+        "orderStatus": [
+            [IN.ORDER_STATUS]
+            + ([] if hasMktCapPrice else [17])
+            + [12, "Filled", 100, 0, 101.26, 123456, 0, 101.26, 3, ""]
+            + ([0.0] if hasMktCapPrice else []),
+            [IN.ORDER_STATUS]
+            + ([] if hasMktCapPrice else [17])
+            + [13, "Submitted", "", 50, "", 7, 12, "", 3, "locate"]
+            + ([""] if hasMktCapPrice else []),
+        ],
+        "historicalData": [
+            [IN.HISTORICAL_DATA]
+            + ([3] if legacyBars else [])
+            + [4, "20240104  15:58:00", "20240104  16:00:00", 2]
+            + bars(legacyBars),
+            [IN.HISTORICAL_DATA] + ([3] if legacyBars else []) + [5, "", "", 0],
+        ],
+        "historicalDataUpdate": [
+            [IN.HISTORICAL_DATA_UPDATE, 4, 12, "20240104  16:00:00", 101.25, 101.3, 101.5, 101.2, 101.31, 1500],
+            [IN.HISTORICAL_DATA_UPDATE, 4, -1, "1704412800", 101.25, "", "", "", "", ""],
+        ],
+        "realtimeBar": [
+            [IN.REAL_TIME_BARS, 3, 6, 1704412800, 101.25, 101.5, 101.2, 101.3, 1500, 101.31, 12],
+        ],
+        "tickOptionComputation": [
+            [IN.TICK_OPTION_COMPUTATION, 6, 7, TickTypeEnum.MODEL_OPTION, 0.25, 0.5, 3.2, 0, 0.02, 0.1, -0.05, 450.5],
+            # Not computed indicators
+            [IN.TICK_OPTION_COMPUTATION, 6, 7, TickTypeEnum.BID_OPTION_COMPUTATION, -1, -2, -1, -1, -2, -2, -2, -1],
+            # Old versions only send the prices of model options
+            [IN.TICK_OPTION_COMPUTATION, 5, 7, TickTypeEnum.MODEL_OPTION, 0.25, 0.5, 3.2, 0.1],
+            [IN.TICK_OPTION_COMPUTATION, 5, 7, TickTypeEnum.ASK_OPTION_COMPUTATION, 0.25, 0.5],
+        ],
+        "marketDepthL2": [
+            [IN.MARKET_DEPTH_L2, 1, 8, 0, "ARCA", 0, 1, 101.25, 300] + ([1] if serverVersion >= 146 else []),
+            [IN.MARKET_DEPTH_L2, 1, 8, 2, "", 2, 0, "", ""] + ([""] if serverVersion >= 146 else []),
+        ],
+        "pnl": [[IN.PNL, 9] + pnlFields],
+        "pnlSingle": [[IN.PNL_SINGLE, 10, 100] + pnlFields + [10125.5]],
+    }
+
+
+MESSAGES = [
+    pytest.param(serverVersion, fields, id=f"{name}-{serverVersion}-{index}")
+    for serverVersion in SERVER_VERSIONS
+    for name, frames in messages(serverVersion).items()
+    for index, fields in enumerate(frames)
+]
+
+
+@pytest.mark.parametrize("serverVersion,fields", MESSAGES)
+def test_specialized_handlers_match_the_stock_decoder(serverVersion, fields):
+    expected = stockCalls(serverVersion, fieldBuffer(*fields))
+
+    assert expected
+    assert fastCalls(serverVersion, fieldBuffer(*fields)) == expected
+
+
+def test_decodes_like_the_stock_decoder_before_specializing():
+    wrapper = RecordingWrapper()
+    decoder = FastDecoder(wrapper, 151)
+    fields = [IN.TICK_PRICE, 6, 1, TickTypeEnum.BID, 101.25, 300, 7]
+
+    assert decode(decoder, wrapper, fieldBuffer(*fields)) == stockCalls(151, fieldBuffer(*fields))
+
+
+SIGNATURE_MESSAGES = {
+    "tickSize": [IN.TICK_SIZE, 6, 1, TickTypeEnum.BID_SIZE, 300],
+    "tickString": [IN.TICK_STRING, 6, 1, TickTypeEnum.LAST_TIMESTAMP, "1704412800"],
+    "tickGeneric": [IN.TICK_GENERIC, 6, 1, TickTypeEnum.HALTED, "0.0"],
+    "error": [IN.ERR_MSG, 2, 4, 162, "Historical Market Data Service error message:HMDS query returned no data"],
+    "nextValidId": [IN.NEXT_VALID_ID, 1, 1001],
+    "currentTime": [IN.CURRENT_TIME, 1, 1704412800],
+    "managedAccounts": [IN.MANAGED_ACCTS, 1, "DU123456,DU654321"],
+    "contractDetailsEnd": [IN.CONTRACT_DATA_END, 1, 3],
+}
+
+
+@pytest.mark.parametrize("fields", SIGNATURE_MESSAGES.values(), ids=SIGNATURE_MESSAGES.keys())
+def test_signature_handlers_match_the_stock_decoder(fields):
+    expected = stockCalls(151, fieldBuffer(*fields))
+
+    assert expected
+    assert fastCalls(151, fieldBuffer(*fields)) == expected
+
+
+def test_signature_handlers_decode_text_that_is_not_utf8_like_the_stock_decoder():
+    payload = b"4\x002\x004\x00200\x00Aucune d\xe9finition trouv\xe9e\x00"
+
+    assert fastCalls(151, FieldBuffer(payload)) == stockCalls(151, FieldBuffer(payload))
+
+
+class ColumnarWrapper(RecordingWrapper):
+    """ A wrapper taking the bars of a HISTORICAL_DATA message column by column """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.bars = {}
+
+    def historicalDataColumns(self, reqId: int, bars) -> None:
+        self.bars[reqId] = bars
+
+
+@pytest.mark.parametrize("serverVersion", SERVER_VERSIONS)
+def test_columnar_historical_data_matches_the_bars_of_the_stock_decoder(serverVersion):
+    fields = messages(serverVersion)["historicalData"][0]
+    expected = stockCalls(serverVersion, fieldBuffer(*fields))
+
+    wrapper = ColumnarWrapper()
+    calls = fastCalls(serverVersion, fieldBuffer(*fields), wrapper)
+
+    assert wrapper.bars[4].to_rows() == [args[1][1] for name, args in expected if name == "historicalData"]
+    assert calls[-1] == expected[-1]
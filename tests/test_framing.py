@@ -0,0 +1,66 @@
+import pytest
+
+from sibi.framing import ITER_CHUNK_SIZE, FieldBuffer
+
+
+def splitFields(payload: bytes) -> tuple:
+    """ The split_fields FieldBuffer replaced """
+
+    return tuple(payload.split(b"\0")[:-1])
+
+
+PAYLOADS = [
+    b"",
+    b"\0",
+    b"1\0",
+    b"1\02\03\0",
+    b"1\0\0\03\0",  # Empty fields
+    b"1\02\0trailing",  # A trailing field without terminator isn't a field
+    b"17\01\0" + b"20240105  16:00:00\0101.25\0" * 500,  # Over ITER_CHUNK_SIZE
+    b"\0".join([b"x" * (ITER_CHUNK_SIZE + 10), b"", b"y"]) + b"\0",  # A field longer than a chunk
+    b"1\0" * ITER_CHUNK_SIZE + b"trailing",
+]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_behaves_like_split_fields(payload):
+    expected = splitFields(payload)
+    fields = FieldBuffer(payload)
+
+    assert tuple(fields) == expected
+    assert len(fields) == len(expected)
+    assert [fields[index] for index in range(len(expected))] == list(expected)
+    assert fields[1:3] == expected[1:3]
+    assert fields[::-1] == expected[::-1]
+    if expected:
+        assert fields[-1] == expected[-1]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_frame_inside_a_receive_buffer(payload):
+    head = b"\0\0\0\x09previous\0"
+    buffer = head + payload + b"next\0frame\0"
+    start = len(head)
+    fields = FieldBuffer(buffer, start, start + len(payload))
+
+    assert tuple(fields) == splitFields(payload)
+    assert len(fields) == len(splitFields(payload))
+    assert fields.nbytes == len(payload)
+    assert bytes(fields.view) == payload
+
+
+def test_random_access_before_iteration():
+    payload = b"\0".join(b"%d" % index for index in range(3000)) + b"\0"
+    fields = FieldBuffer(payload)
+
+    assert fields[2500] == b"2500"
+    assert fields[10] == b"10"
+    assert tuple(fields) == splitFields(payload)
+
+
+@pytest.mark.parametrize("index", [3, -4])
+def test_index_out_of_range(index):
+    fields = FieldBuffer(b"1\02\03\0trailing")
+
+    with pytest.raises(IndexError):
+        fields[index]
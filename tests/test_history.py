@@ -0,0 +1,96 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from sibi.history import NO_DATA, planChunks, stitch, stitchResults
+from sibi.models import HistoricalBars
+
+
+def makeBars(*dates):
+    bars = HistoricalBars()
+    for index, date in enumerate(dates):
+        bars.extend(
+            HistoricalBars.from_dict(
+                {
+                    "date": [date],
+                    "open": [index],
+                    "high": [index],
+                    "low": [index],
+                    "close": [index],
+                    "volume": [index],
+                    "barCount": [index],
+                    "average": [index],
+                }
+            )
+        )
+    return bars
+
+
+def test_request_within_the_window_is_not_split():
+    assert planChunks("20240105 16:00:00", "1 D", "1 min") == [("20240105 16:00:00", "1 D")]
+    assert planChunks("", "3 Y", "1 week") == [("", "3 Y")]
+
+
+def test_request_is_split_newest_first():
+    chunks = planChunks("20240105 16:00:00 US/Eastern", "3 D", "1 min")
+
+    assert chunks == [
+        ("20240105 16:00:00 US/Eastern", "1 D"),
+        ("20240104 16:00:00 US/Eastern", "1 D"),
+        ("20240103 16:00:00 US/Eastern", "1 D"),
+    ]
+
+
+def test_last_chunk_covers_the_remainder():
+    chunks = planChunks("20240105-16:00:00", "4000 S", "1 sec")
+
+    assert chunks == [
+        ("20240105-16:00:00", "1800 S"),
+        ("20240105-15:30:00", "1800 S"),
+        ("20240105-15:00:00", "400 S"),
+    ]
+
+
+def test_empty_end_stays_empty_for_the_newest_chunk():
+    chunks = planChunks("", "2 D", "1 min", now=datetime(2024, 1, 5, 16, 0, 0, 123))
+
+    assert chunks == [("", "1 D"), ("20240104 16:00:00", "1 D")]
+
+
+def test_unsupported_end_date_time():
+    with pytest.raises(ValueError):
+        planChunks("yesterday", "3 D", "1 min")
+
+
+def test_stitch_orders_and_deduplicates():
+    older = makeBars("20240104  15:58:00", "20240104  15:59:00")
+    newer = makeBars("20240104  15:59:00", "20240104  16:00:00")
+
+    bars = stitch([newer, older])
+
+    assert bars.date == ["20240104  15:58:00", "20240104  15:59:00", "20240104  16:00:00"]
+    # The last chunk given wins on overlaps
+    assert list(bars.close) == [0, 1, 1]
+
+
+def test_stitch_orders_epochs_by_value():
+    bars = stitch([makeBars("1704412800"), makeBars("999999999")])
+
+    assert bars.date == ["999999999", "1704412800"]
+
+
+def test_stitch_results_skips_chunks_without_data():
+    results = [
+        json.dumps(makeBars("20240104").to_dict()),
+        json.dumps({"reqId": 2, "code": 162, "message": f"HMDS query {NO_DATA}"}),
+    ]
+
+    assert json.loads(stitchResults(results, columnar=True))["date"] == ["20240104"]
+    assert json.loads(stitchResults(results)) == makeBars("20240104").to_rows()
+
+
+def test_stitch_results_returns_other_errors():
+    error = json.dumps({"reqId": 2, "code": 200, "message": "No security definition"})
+
+    assert stitchResults([json.dumps(makeBars("20240104").to_dict()), error]) == error
@@ -0,0 +1,78 @@
+import json
+import struct
+
+import pytest
+from twisted.internet.testing import StringTransport
+from twisted.python.failure import Failure
+
+from sibi.ib_factory import IBClientFactory
+from sibi.ibapi.contract import Contract
+from sibi.ibapi.errors import NOT_CONNECTED
+
+
+def frame(*fields) -> bytes:
+    text = b"".join(str(field).encode() + b"\0" for field in fields)
+    return struct.pack("!I", len(text)) + text
+
+
+def connect(factory):
+    """ Connects factory to a StringTransport and completes the handshake """
+
+    protocol = factory.buildProtocol(None)
+    transport = StringTransport()
+    protocol.makeConnection(transport)
+    protocol.dataReceived(frame(151, "20240105 10:00:00 CET"))
+    protocol.setTimeout(None)
+    transport.clear()
+    return protocol, transport
+
+
+def disconnect(factory, protocol):
+    protocol.connectionLost(Failure(ConnectionError("lost")))
+    factory.clientConnectionLost(None, Failure(ConnectionError("lost")))
+
+
+@pytest.fixture
+def factory():
+    factory = IBClientFactory(0, msgBurst=100)
+    # Reconnections are made by the tests
+    factory.continueTrying = False
+    return factory
+
+
+def spy():
+    contract = Contract()
+    contract.symbol = "SPY"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    return contract
+
+
+def test_requests_in_flight_fail_on_connection_lost(factory):
+    protocol, transport = connect(factory)
+    results = []
+    factory.reqContractDetails(spy()).addCallback(results.append)
+    factory.reqContractDetails(spy()).addCallback(results.append)
+    assert transport.value()
+
+    disconnect(factory, protocol)
+
+    assert [json.loads(result)["code"] for result in results] == [NOT_CONNECTED.code()] * 2
+    assert factory.deferredRequests == {}
+    assert factory.inflightRequests == {}
+
+
+def test_identical_request_reaches_tws_after_reconnecting(factory):
+    protocol, _ = connect(factory)
+    factory.reqContractDetails(spy())
+    disconnect(factory, protocol)
+
+    _, transport = connect(factory)
+    results = []
+    factory.reqContractDetails(spy()).addCallback(results.append)
+
+    assert transport.value()
+    reqId = max(factory.deferredRequests)
+    factory.contractDetailsEnd(reqId)
+    assert results == ["[]"]
@@ -0,0 +1,37 @@
+from sibi.latency import BUCKETS, LINEAR_BUCKETS, LatencyHistogram, bucketBound, bucketOf
+
+
+def test_small_values_have_exact_buckets():
+    assert [bucketOf(ns) for ns in range(LINEAR_BUCKETS)] == list(range(LINEAR_BUCKETS))
+    assert bucketOf(-5) == 0
+
+
+def test_every_value_is_below_the_bound_of_its_bucket():
+    for ns in range(1, 1 << 16):
+        index = bucketOf(ns)
+        assert ns < bucketBound(index)
+        if index > 0:
+            assert ns >= bucketBound(index - 1)
+
+
+def test_bounds_increase_with_a_quarter_resolution():
+    bounds = [bucketBound(index) for index in range(BUCKETS - 1)]
+
+    assert bounds == sorted(set(bounds))
+    for index in range(LINEAR_BUCKETS, BUCKETS - 2):
+        assert bounds[index + 1] - bounds[index] <= bounds[index] / 4
+
+
+def test_huge_values_go_to_the_last_bucket():
+    assert bucketOf(1 << 80) == BUCKETS - 1
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for ns in range(1, 101):
+        histogram.record(ns * 1000)
+
+    assert histogram.count == 100
+    assert histogram.max == 100_000
+    assert 50_000 <= histogram.percentile(50) <= 50_000 * 1.25
+    assert histogram.percentile(100) == 100_000
@@ -0,0 +1,27 @@
+from sibi.ibapi.ticktype import TickTypeEnum
+from sibi.quotes import QuoteTable
+from sibi.ticks import PRICE, SIZE, TickPipeline
+
+
+def test_quotes_are_stamped_with_the_pipeline_time():
+    def clock():
+        raise AssertionError("the quote table must not read the clock per tick")
+
+    pipeline = TickPipeline(clock=iter([1_700_000_000_500_000_000, 1_700_000_001_000_000_000]).__next__)
+    quotes = pipeline.add(QuoteTable(clock=clock))
+
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.5)
+    pipeline.emit(1, TickTypeEnum.BID_SIZE, SIZE, 300)
+
+    quote = quotes.get(1).to_dict()
+    assert quote["bid"] == 10.5 and quote["bidSize"] == 300
+    assert quote["bidTime"] == 1_700_000_000.5
+    assert quote["updated"] == 1_700_000_001.0
+
+
+def test_direct_updates_default_to_now():
+    quotes = QuoteTable(clock=lambda: 42.0)
+
+    quotes.update(1, TickTypeEnum.LAST, 10.5)
+
+    assert quotes.get(1).lastTime == quotes.get(1).updated == 42.0
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from sibi.shm import ShmTickReader, ShmTickWriter
+from sibi.wire import Tick
+
+
+@pytest.fixture
+def writer():
+    writer = ShmTickWriter(f"sibi-test-{os.getpid()}", capacity=4)
+    yield writer
+    writer.close()
+
+
+def test_reader_gets_ticks_written_after_attaching(writer):
+    writer.write(1, 1, 10.0, 100)
+    reader = ShmTickReader(writer.name)
+    writer.write(2, 2, 10.5, 200)
+    writer.write(3, 3, 11.0, 300)
+
+    assert reader.poll() == [Tick(2, 2, 10.5, 200), Tick(3, 3, 11.0, 300)]
+    assert reader.poll() == []
+    reader.close()
+
+
+def test_reader_from_start(writer):
+    writer.write(1, 1, 10.0, 100)
+    reader = ShmTickReader(writer.name, fromStart=True)
+
+    assert reader.poll() == [Tick(1, 1, 10.0, 100)]
+    reader.close()
+
+
+def test_slow_reader_counts_lost_ticks(writer):
+    reader = ShmTickReader(writer.name)
+    for index in range(6):
+        writer.write(index, 1, float(index), index)
+
+    assert [tick.reqId for tick in reader.poll()] == [2, 3, 4, 5]
+    assert reader.lost == 2
+    reader.close()
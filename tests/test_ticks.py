@@ -0,0 +1,68 @@
+from sibi.ibapi.ticktype import TickTypeEnum
+from sibi.ticks import PRICE, SIZE, CallbackSink, TickPipeline, parseTickTypes
+
+
+def makePipeline():
+    clock = iter(range(1, 1000))
+    return TickPipeline(clock=lambda: next(clock))
+
+
+def test_every_sink_gets_every_tick_type_without_filter():
+    pipeline = makePipeline()
+    first, second = [], []
+    pipeline.add(CallbackSink(first.append))
+    pipeline.add(CallbackSink(second.append))
+
+    event = pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.5)
+
+    assert first == second == [event]
+    assert event.reqId == 1 and event.value == 10.5 and event.ts == 1
+    assert pipeline.emitted == 1
+
+
+def test_sinks_only_get_their_tick_types():
+    pipeline = makePipeline()
+    bids, sizes = [], []
+    pipeline.add(CallbackSink(bids.append, tickTypes=[TickTypeEnum.BID]))
+    pipeline.add(CallbackSink(sizes.append, tickTypes=[TickTypeEnum.BID_SIZE]))
+
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.5)
+    pipeline.emit(1, TickTypeEnum.BID_SIZE, SIZE, 100)
+
+    assert [event.tickType for event in bids] == [TickTypeEnum.BID]
+    assert [event.tickType for event in sizes] == [TickTypeEnum.BID_SIZE]
+
+
+def test_tick_nobody_wants_is_not_emitted():
+    pipeline = makePipeline()
+    pipeline.add(CallbackSink(lambda event: None, tickTypes=[TickTypeEnum.BID]))
+
+    assert pipeline.emit(1, TickTypeEnum.ASK, PRICE, 10.5) is None
+    assert pipeline.emitted == 0
+
+
+def test_routes_follow_added_and_removed_sinks():
+    pipeline = makePipeline()
+    events = []
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.5)
+    sink = pipeline.add(CallbackSink(events.append))
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.6)
+    pipeline.remove(sink)
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.7)
+
+    assert [event.value for event in events] == [10.6]
+
+
+def test_receive_time_is_carried():
+    pipeline = makePipeline()
+    events = []
+    pipeline.add(CallbackSink(events.append))
+
+    pipeline.emit(1, TickTypeEnum.BID, PRICE, 10.5, receivedAt=42)
+
+    assert events[0].receivedAt == 42
+
+
+def test_parse_tick_types():
+    assert parseTickTypes("") is None
+    assert parseTickTypes("bid, ASK,4") == {TickTypeEnum.BID, TickTypeEnum.ASK, 4}